@@ -1,12 +1,10 @@
-import keyboard
 from kb import KB
 from hand import Hand
 import logging
 import rectangle
 #from pymouse import PyMouse
-from keyboard import mac_command, mac_keyboard
+from dispatch import Dispatcher
 import time
-from pykeyboard import PyKeyboard
 
 
 class Actions(object):
@@ -27,9 +25,10 @@ class Action(object):
   the first hand position of a gesture) to allow more complex movements like
   window movement.
   """
-  def __init__(self):
+  def __init__(self, dispatcher = None, kb = None):
     # Access knowledge base to check hand state
-    self.kb = KB()
+    # (pass the knowledge base of the tracker)
+    self.kb = kb if kb else KB()
     # Platform independent mouse support
     #self.m = PyMouse()
     # Remember which keys are pressed
@@ -49,7 +48,8 @@ class Action(object):
     self.KeyLeft = 123
     self.KeyRight = 124
 
-    self.k = PyKeyboard()
+    # Keyboard commands are executed in the background
+    self.dispatcher = dispatcher if dispatcher else Dispatcher()
 
   def execute(self, action):
     """
@@ -92,7 +92,7 @@ class Action(object):
     """
     Run expose / Mission control
     """
-    keyboard.mac_keyboard([],"F1") 
+    self.dispatcher.submit("keyboard", [], "F1")
 
   def keyboard_handler(self):
     """
@@ -102,20 +102,20 @@ class Action(object):
     if abs(dx) > abs(dy):
       if dx < 0:
         print "right"
-        self.k.press_key(self.KeyRight)
+        self.dispatcher.submit("press_key", self.KeyRight)
         #mac_keyboard([], "d")
       else:
         print "left"
-        self.k.press_key(self.KeyLeft)
+        self.dispatcher.submit("press_key", self.KeyLeft)
         #mac_keyboard([], "a")
     else:
       if dy < 0:
         print "down"
-        self.k.press_key(self.KeyDown)
+        self.dispatcher.submit("press_key", self.KeyDown)
         #mac_keyboard([], "s")
       else:
         print "up"
-        self.k.press_key(self.KeyUp)
+        self.dispatcher.submit("press_key", self.KeyUp)
         #mac_keyboard([], "w")
 
   def pointer_handler(self):
@@ -140,16 +140,15 @@ class Action(object):
     """
     try:
       h = self.kb.history
-      curr = h[-1].pos["estimate"]
+      curr = h.rect(-1)
 
       # Store the first hand position of the gesture for later
       if not self.reference_point:
-        prev_estimate = h[-2].pos["estimate"]
-        reference_rect = prev_estimate.pos
+        reference_rect = h.rect(-2)
         self.reference_point = rectangle.center(reference_rect)
 
       # Get center of hand
-      curr_center = rectangle.center(curr.pos)
+      curr_center = rectangle.center(curr)
 
       # Movement
       if relative:
@@ -228,7 +227,7 @@ class Action(object):
       # Already pressed
       return
     cmd = "key down {}".format(key)
-    mac_command("System Events", cmd)
+    self.dispatcher.submit("command", "System Events", cmd)
     self.pressed_keys.append(key)
 
   def release(self, key):
@@ -239,7 +238,7 @@ class Action(object):
       # Not pressed
       return
     cmd = "key up {}".format(key)
-    mac_command("System Events", cmd)
+    self.dispatcher.submit("command", "System Events", cmd)
     self.pressed_keys.remove(key)
 
   def reset(self):
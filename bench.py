@@ -1,6 +1,10 @@
 # Example benchmark
 import time
 import logging
+import signal
+import threading
+from collections import deque
+import numpy as np
 
 def benchmark(func):
     """
@@ -15,3 +19,156 @@ def benchmark(func):
         return r
 
     return st_func
+
+class Span(object):
+    """
+    Measures the time of a nested block of code.
+    The span is stored under the path of all enclosing spans,
+    e.g. "frame/detect/haar".
+    """
+    def __init__(self, profiler, name, parent=None):
+        self.profiler = profiler
+        self.name = name
+        self.parent = parent
+
+    def __enter__(self):
+        stack = self.profiler.get_stack()
+        if self.parent is None:
+            self.parent = stack[-1] if stack else ""
+        self.path = self.parent + "/" + self.name if self.parent else self.name
+        stack.append(self.path)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.time() - self.start
+        self.profiler.get_stack().pop()
+        self.profiler.add(self.path, duration)
+        return False
+
+class NoSpan(object):
+    """
+    Does nothing. Used when profiling is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+class Profiler(object):
+    """
+    Collects the duration of nested spans in memory.
+    For each span path, the last few samples are kept
+    to calculate rolling statistics.
+    The summary is logged periodically and on a signal (SIGUSR1).
+    """
+    def __init__(self, history=1000, report_interval=30.0):
+        self.enabled = True
+        self.history = history
+        self.report_interval = report_interval
+        self.last_report = time.time()
+        # Set by the signal handler. The report itself is written by
+        # maybe_report() because the handler may interrupt add(),
+        # which holds the lock.
+        self.report_requested = False
+        self.samples = {}
+        self.lock = threading.Lock()
+        # Each thread has its own stack of open spans
+        self.local = threading.local()
+        self.no_span = NoSpan()
+
+    def span(self, name, parent=None):
+        """
+        Time a block of code:
+            with profiler.span("detect"):
+                ...
+        Spans in worker threads can be attached to a span
+        of another thread with parent (see current()).
+        """
+        if not self.enabled:
+            return self.no_span
+        return Span(self, name, parent)
+
+    def current(self):
+        """
+        Path of the innermost open span of the calling thread
+        """
+        stack = self.get_stack()
+        return stack[-1] if stack else ""
+
+    def get_stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def add(self, path, duration):
+        with self.lock:
+            if path not in self.samples:
+                self.samples[path] = deque(maxlen=self.history)
+            self.samples[path].append(duration)
+
+    def summary(self):
+        """
+        Statistics for each span in milliseconds
+        """
+        with self.lock:
+            samples = dict((path, list(s)) for path, s in self.samples.items())
+        stats = {}
+        for path, s in samples.items():
+            ms = np.array(s) * 1000.0
+            stats[path] = {
+                "count": len(ms),
+                "mean": float(np.mean(ms)),
+                "p50": float(np.percentile(ms, 50)),
+                "p95": float(np.percentile(ms, 95)),
+                "max": float(np.max(ms))
+            }
+        return stats
+
+    def report(self):
+        """
+        Log the summary, one line per span
+        """
+        stats = self.summary()
+        for path in sorted(stats):
+            s = stats[path]
+            logging.info("Profile: %-40s n=%5d mean=%7.2fms p50=%7.2fms p95=%7.2fms max=%7.2fms",
+                path, s["count"], s["mean"], s["p50"], s["p95"], s["max"])
+
+    def maybe_report(self):
+        """
+        Log the summary if the report interval has passed
+        or a report was requested by a signal
+        """
+        if self.report_requested:
+            self.report_requested = False
+            self.last_report = time.time()
+            self.report()
+            return
+        if not self.enabled or not self.report_interval:
+            return
+        now = time.time()
+        if now - self.last_report > self.report_interval:
+            self.last_report = now
+            self.report()
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR1", None)):
+        """
+        Log the summary when the process receives a signal
+        (e.g. kill -USR1 <pid>). Must be called from the main thread.
+        The summary is logged at the next call of maybe_report().
+        """
+        if signum is None:
+            return
+        signal.signal(signum, lambda signum, frame: self.request_report())
+
+    def request_report(self):
+        self.report_requested = True
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+
+# Shared profiler for all modules
+profiler = Profiler()
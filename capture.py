@@ -0,0 +1,158 @@
+"""
+Threaded camera input.
+"""
+
+import cv2
+import threading
+import logging
+import numpy as np
+
+class Capture(object):
+  """
+  Grab frames from a camera in a separate thread.
+
+  The capture thread owns the camera and writes resized (and optionally
+  mirrored) frames into a small ring of preallocated buffers.
+  The main loop always gets the newest frame. Frames which were
+  never picked up are dropped.
+  """
+  def __init__(self, camera, width, height, flip = True, buffer_size = 3):
+    self.camera = camera
+    self.width  = width
+    self.height = height
+    self.flip   = flip
+
+    # We need at least three slots: One for the reader,
+    # one for the latest frame and one to write into.
+    buffer_size = max(3, buffer_size)
+    self.buffer = [np.zeros((height, width, 3), np.uint8) for i in range(buffer_size)]
+    # Resized frame before flipping
+    self.scratch = np.zeros((height, width, 3), np.uint8)
+
+    self.lock = threading.Condition()
+    # Slot which holds the newest frame
+    self.latest = None
+    # Slot which is currently used by the main loop
+    self.reading = None
+    # Sequence number of the newest frame and the last frame read
+    self.latest_seq = 0
+    self.read_seq = 0
+
+    # Number of frames to skip (see skip())
+    self.pending_skip = 0
+
+    # Statistics
+    self.frames_captured  = 0
+    self.frames_delivered = 0
+    self.frames_dropped   = 0
+
+    self.running = False
+    self.thread = None
+
+  def start(self):
+    """
+    Start the capture thread
+    """
+    self.running = True
+    self.thread = threading.Thread(target=self.run, name="Capture")
+    # Don't keep the program alive because of the camera
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    """
+    Stop the capture thread and wake up waiting readers.
+    """
+    with self.lock:
+      self.running = False
+      self.lock.notify_all()
+
+  def run(self):
+    """
+    Capture loop. Runs until the camera delivers no more frames.
+    """
+    while self.running:
+      self.skip_pending()
+      ok, img = self.camera.read()
+      if not ok or img is None:
+        logging.info("Capture: No more frames")
+        break
+      slot = self.next_slot()
+      self.store(img, self.buffer[slot])
+      self.publish(slot)
+    self.stop()
+
+  def store(self, img, dst):
+    """
+    Resize (and mirror) a camera frame into a preallocated buffer.
+    """
+    if self.flip:
+      cv2.resize(img, (self.width, self.height), self.scratch)
+      cv2.flip(self.scratch, 1, dst)
+    else:
+      cv2.resize(img, (self.width, self.height), dst)
+
+  def next_slot(self):
+    """
+    Find a slot which is neither read nor holds the newest frame.
+    """
+    with self.lock:
+      for i in range(len(self.buffer)):
+        if i != self.latest and i != self.reading:
+          return i
+
+  def publish(self, slot):
+    """
+    Make a freshly written slot the newest frame.
+    """
+    with self.lock:
+      if self.latest_seq > self.read_seq:
+        # The previous frame was never picked up
+        self.frames_dropped += 1
+      self.latest = slot
+      self.latest_seq += 1
+      self.frames_captured += 1
+      self.lock.notify_all()
+
+  def read(self):
+    """
+    Wait for a new frame and return it.
+    The frame stays valid until the next call to read().
+    Returns None if the capture has stopped.
+    """
+    with self.lock:
+      while self.latest_seq == self.read_seq and self.running:
+        self.lock.wait(1.0)
+      if self.latest_seq == self.read_seq:
+        return None
+      self.reading = self.latest
+      self.read_seq = self.latest_seq
+      self.frames_delivered += 1
+      return self.buffer[self.reading]
+
+  def skip(self, x=1):
+    """
+    Skip the next x frames (e.g. to jump forward in a video).
+    """
+    with self.lock:
+      self.pending_skip += x
+
+  def skip_pending(self):
+    """
+    Drop requested frames without decoding them
+    """
+    with self.lock:
+      x, self.pending_skip = self.pending_skip, 0
+    for i in range(x):
+      self.camera.grab()
+
+  def stats(self):
+    """
+    Frame counters of the capture stage
+    """
+    with self.lock:
+      return {
+        "captured"  : self.frames_captured,
+        "delivered" : self.frames_delivered,
+        "dropped"   : self.frames_dropped
+      }
@@ -1,8 +1,12 @@
 from collections import namedtuple
 from itertools import combinations
+from multiprocessing.pool import ThreadPool
 import logging
 
 from face import Face
+from frame_context import FrameContext
+from bench import profiler
+from motion import AlphaBetaFilter
 from hand import Hand
 from hand_pos import Outline, HandPos
 import rectangle
@@ -97,19 +101,40 @@ class Detector:
     # detectors it depends on has a high detection probability
     self.min_bootstrap_prob = 0.9
 
+    # Run position detectors concurrently.
+    # They only read the current image and OpenCV releases the GIL
+    # during the heavy lifting, so the frame latency is roughly the
+    # time of the slowest detector instead of the sum of all.
+    self.parallel = True
+    self.pool = ThreadPool(len(self.detectors)) if self.parallel else None
+
+    # Trace the full tree of skin contours (needed for drawing them).
+    # Otherwise only the outer hand contour is traced.
+    self.contour_tree = True
+
     # There is no initial prediction for the hand position
     # since the detectors didn't run yet.
     self.positions = {"estimate": HandPos()}
 
+    # Motion model to smooth the estimate and to predict the
+    # hand position in the next frame
+    self.motion = AlphaBetaFilter(alpha = 0.5, beta = 0.2, max_misses = 5)
+    # Expected hand position in the current frame (or None)
+    self.hint = None
+    # Probability of the last estimate. Decays while we only predict.
+    self.estimate_prob = 0.0
+    self.prediction_decay = 0.8
+
   def detect(self, img):
     """
     Detects state of hand (position and fingers).
     """
-    # Work on a copy of the original image
-    # to prevent the user from seeing temporary image modifications
-    # (i.e. face removal)
-    self.current_img = img.copy()
-    self.preprocess()
+    # Derived planes (HSV, grayscale,...) are shared by all detectors.
+    # The frame never modifies img. Removed faces are only
+    # blacked out in the derived planes.
+    self.frame = FrameContext(img)
+    with profiler.span("faces"):
+      self.preprocess()
     self.positions = self.get_hand_pos()
 
     hand = self.get_hand()
@@ -121,8 +146,11 @@ class Detector:
     If training of detector is not yet completed, return a confidence of 0.
     Returns none if no hand position was found.
     """
+    # Tell the detectors where to expect the hand
+    self.hint = self.motion.predict()
     positions = self.run_detectors(DetectorType.POS)
-    positions["estimate"] = self.predict(positions)
+    with profiler.span("predict"):
+      positions["estimate"] = self.predict(positions)
     return positions
 
   def get_hand(self):
@@ -130,6 +158,10 @@ class Detector:
     Returns the properties of a hand at the given position.
     This will only work, if the position for the hand is correct.
     """
+    skin = self.detectors["skin"]["instance"]
+    if skin:
+      skin.contour_tree = self.contour_tree
+
     hands = self.run_detectors(DetectorType.HAND)
     if hands:
       hand = hands["skin"]
@@ -143,6 +175,9 @@ class Detector:
     """
     Run all detectors of a certain type
     """
+    if self.parallel and detector_type == DetectorType.POS:
+      return self.run_detectors_parallel(detector_type)
+
     results = {}
     for detector_name, parameters in self.detectors.iteritems():
       # Check if detector is of the correct type and should be used
@@ -155,9 +190,65 @@ class Detector:
           logging.exception("Detector: Problem running detector")
     return results
 
+  def run_detectors_parallel(self, detector_type):
+    """
+    Run all detectors of a certain type in the thread pool.
+    Detectors which are not running yet get bootstrapped afterwards.
+    Both only depend on the results of the previous frame.
+    """
+    jobs = {}
+    for detector_name, parameters in self.detectors.iteritems():
+      if parameters["use"] and parameters["type"] == detector_type and \
+         self.detector_running(detector_name):
+        jobs[detector_name] = self.pool.apply_async(self.run_detector,
+            (detector_name, parameters, profiler.current()))
+
+    results = {}
+    for detector_name, job in jobs.iteritems():
+      try:
+        result = job.get()
+        if result:
+          results[detector_name] = result
+      except Exception, e:
+        logging.exception("Detector: Problem running detector")
+
+    for detector_name, parameters in self.detectors.iteritems():
+      if parameters["use"] and parameters["type"] == detector_type and \
+         detector_name not in jobs:
+        try:
+          self.run_detector(detector_name, parameters)
+        except Exception, e:
+          logging.exception("Detector: Problem bootstrapping detector")
+    return results
+
   def predict(self, positions):
     """
-    Predict the correct hand position from all detector inputs.
+    Predict the correct hand position from all detector inputs
+    and the motion of the hand in the previous frames.
+    """
+    return self.track(self.combine(positions))
+
+  def track(self, h):
+    """
+    Smooth the estimate with the motion model. If no detector found
+    the hand, use the predicted position for a few frames.
+    """
+    if h.pos is not None:
+      pos = h.pos
+      if h.outline == Outline.ELLIPSE:
+        pos = rectangle.get_bounding_rect(pos)
+      self.estimate_prob = h.prob
+      return HandPos(pos=self.motion.update(pos), prob=h.prob)
+
+    pos = self.motion.miss()
+    if pos is None:
+      return h
+    self.estimate_prob *= self.prediction_decay
+    return HandPos(pos=pos, prob=self.estimate_prob)
+
+  def combine(self, positions):
+    """
+    Combine the current results of all detectors
     """
     # Check if overlapping
     overlapping = predict.positions_overlap(positions)
@@ -171,19 +262,21 @@ class Detector:
     # Fall back to rect with highest probability
     return predict.max_prob(positions)
 
-  def run_detector(self, detector_name, parameters):
+  def run_detector(self, detector_name, parameters, parent=None):
     """
-    Runs a single detector
+    Runs a single detector.
+    parent is the profiling span of the caller if it runs in another thread.
     """
     if self.detector_running(detector_name):
       detector = parameters["instance"]
-      # Check detector type and pass all necessary parameters
-      if parameters["type"] == DetectorType.POS:
-        return detector.detect(self.current_img, self.face_positions)
-      else:
-        # Contrary to position detectors, hand detectors
-        # need a region of interest to detect hand features
-        return detector.detect(self.current_img, self.positions["estimate"].pos)
+      with profiler.span(detector_name, parent):
+        # Check detector type and pass all necessary parameters
+        if parameters["type"] == DetectorType.POS:
+          return detector.detect(self.frame, self.face_positions, self.hint)
+        else:
+          # Contrary to position detectors, hand detectors
+          # need a region of interest to detect hand features
+          return detector.detect(self.frame, self.positions["estimate"].pos)
 
     # Detector not running yet. Can we start?
     if parameters["use"] and self.deps_satisfied(detector_name):
@@ -211,13 +304,13 @@ class Detector:
     Remove all faces from image for better hand detection
     """
     if self.remove_faces:
-      self.face_positions = self.face.positions(self.current_img)
+      self.face_positions = self.face.positions(self.frame)
       for f in self.face_positions:
         x1, y1, x2, y2 = f
         #width = x2-x1
         #x1 = int(x1 + width/4)
         #x2 = int(x2 - width/4)
-        self.current_img[y1:y2,x1:x2] = 0
+        self.frame.erase([x1, y1, x2, y2])
     else:
       self.face_positions = None
 
@@ -260,7 +353,8 @@ class Detector:
     pos = self.positions["estimate"].pos
 
     # Store instance of detector for later calls
-    parameters["instance"] = detector(self.config, self.current_img, pos)
+    # Only copies the image if faces have been removed
+    parameters["instance"] = detector(self.config, self.frame.bgr(), pos)
 
   def set_config(config):
     """
@@ -278,3 +372,4 @@ class Detector:
     """
     for detector_name, parameters in self.detectors.iteritems():
       parameters["instance"] = None
+    self.motion.reset()
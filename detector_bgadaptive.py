@@ -42,22 +42,21 @@ class DetectorAdaptive:
     self.offset = (x1, y1)
     return img[y1:y2,x1:x2]
 
-  def preprocess(self, img, roi):
+  def preprocess(self, frame, roi):
     """
     The preprocessing step prepares the image to improve detection probability.
     """
     #img = self.crop(img, roi)
     # TODO: Try adaptive threshold
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    return img
+    return frame.gray()
 
   #@benchmark
-  def detect(self, img, roi):
+  def detect(self, frame, roi):
     """
     Find hand object (fingers, contours) in region of interest
     """
     # Only consider region of interest
-    img = self.preprocess(img, roi)
+    img = self.preprocess(frame, roi)
 
     background = self.mog.apply(img)
     cv2.imshow("BG", background)
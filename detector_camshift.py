@@ -1,6 +1,7 @@
 import cv, cv2
 import numpy as np
 from hand_pos import Outline, HandPos
+from frame_context import FrameContext
 import rectangle
 from bench import benchmark
 import logging
@@ -29,7 +30,7 @@ class DetectorCamshift:
     # Create histogram from roi
     self.set_track_window(roi)
     # Run detection for inital back projection
-    self.detect(img, None)
+    self.detect(FrameContext(img), None)
 
   def set_track_window(self, roi):
     # Calculate initial track window
@@ -45,11 +46,11 @@ class DetectorCamshift:
       #self.track_window = (x0 + int(height/2), y0 + int(width/4), height, width - int(width/4))
       self.track_window = (x0, y0, width, height)
 
-  def preprocess(self, img):
+  def preprocess(self, frame):
     """
     The preprocessing step prepares the image to improve detection probability.
     """
-    self.hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    self.hsv = frame.hsv()
 
   def set_mask(self, hsv):
     # Use default values...
@@ -66,12 +67,13 @@ class DetectorCamshift:
     #self.mask = cv2.inRange(hsv, LOWER, UPPER)
 
   #@benchmark
-  def detect(self, img, face_pos):
+  def detect(self, frame, face_pos, hint = None):
     """
-    Track blobs with camshift
+    Track blobs with camshift.
+    The expected hand position (hint) is not used by this detector.
     Returns a needle hypothesis and the confidence that it is correct.
     """
-    self.preprocess(img)
+    self.preprocess(frame)
 
     x0, y0, x1, y1 = self.roi
     self.set_mask(self.hsv)
@@ -38,56 +38,252 @@ class DetectorHaar:
       min_overlapping = 0.5
     )
 
+    # Tracking mode: Once the confidence is high, only search an
+    # expanded window around the last hand position.
+    self.roi_tracking = True
+    # Minimum confidence to enable tracking
+    self.min_tracking_conf = 0.8
+    # Size of search window relative to the last hand position
+    self.roi_expand = 2.0
+    # Allowed change of hand size between two frames
+    self.roi_size_tolerance = 1.3
+    # Scan the whole image at least every few frames
+    self.full_scan_interval = 10
+    # Number of frames since the last full scan
+    self.frames_since_scan = 0
+
+    # Only run the cascades on every n-th frame (1: every frame).
+    # Positions in between are interpolated from the history.
+    self.detect_interval = 1
+    self.frames_since_detect = 0
+    # Interpolated positions are not confirmed by the cascades.
+    # Their probability decays by this factor per skipped frame.
+    self.interpolation_decay = 0.5
+    # Detect on a downscaled image (0: full size, 1: half size, ...)
+    self.pyramid_level = 0
+    self.pyramid = None
+    # Expected hand position in the current frame
+    self.hint = None
+
+    # Return up to k hypotheses, rated by the number of neighbours
+    # (overlapping raw detections) of each rectangle
+    self.top_k = 3
+    self.group_eps = 0.2
+
   #@benchmark
-  def detect(self, img, face_pos):
+  def detect(self, frame, face_pos, hint = None):
     """
     Find blobs which match a given HAAR cascade.
+    hint is the expected hand position in this frame (or None).
     Returns a needle hypothesis and the confidence that it is correct.
     """
+    self.hint = hint
+    if not self.scheduled():
+      # Save time and guess the position from the previous detections
+      return self.interpolate()
 
-    for classifier in self.classifiers:
-      rects = classifier.detectMultiScale(img, scaleFactor=1.2,
-                minNeighbors=self.confidence, minSize=self.min_hand_size,
-                maxSize=self.max_hand_size, flags = cv.CV_HAAR_DO_CANNY_PRUNING |cv.CV_HAAR_SCALE_IMAGE)
-      if len(rects) != 0:
-        # We found a result.
-        # Don't run other classifier
-        break
+    self.frames_since_scan += 1
+    # Both cascades work on the same preprocessed image
+    self.pyramid = self.get_pyramid(frame)
+
+    rects = []
+    if self.tracking():
+      # Only search close to the last hand position
+      rects, neighbours = self.detect_roi()
+    if len(rects) == 0:
+      # Lost track (or no track yet). Search the whole image
+      rects, neighbours = self.detect_full()
 
     if len(rects) == 0:
       # No classifier found a result.
       # Register an outlier.
-      self.kb.update((None, face_pos))
-      # Try to get a valid hand position from
-      # the previous frame
-      f = self.kb.get_last_frame()
-      if not f:
-        return HandPos()
-      hand_pos, face = f
-      return HandPos(pos=hand_pos)
+      return self.outlier(face_pos)
 
     rects = rectangle.convert_from_wh(rects)
 
     if not rects.size:
       # We have not found anything.
       # Register an outlier.
-      self.kb.update((None, face_pos))
-      # Try to get a valid hand position from
-      # the previous frame
-      f = self.kb.get_last_frame()
-      if not f:
-        return HandPos()
-      hand_pos, face = f
-      return HandPos(pos=hand_pos)
+      return self.outlier(face_pos)
 
-    hand_pos = rectangle.max_rect(rects)
+    index = self.max_rect_index(rects)
+    hand_pos = rects[index]
 
     self.kb.update((hand_pos, face_pos))
 
     prob = self.kb.get_confidence()
     logging.debug("Haar: Confidence %s", prob)
+    candidates = self.get_candidates(rects, neighbours, index, prob)
+    return HandPos(pos=hand_pos, prob=prob, outline=Outline.RECT, candidates=candidates)
+
+  def max_rect_index(self, rects):
+    """
+    Index of the widest rectangle (see rectangle.max_rect)
+    """
+    widths = [rect[2] - rect[0] for rect in rects]
+    return widths.index(max(widths))
+
+  def get_candidates(self, rects, neighbours, index, prob):
+    """
+    Further hypotheses besides the selected hand position (rects[index]).
+    Their probability is scaled by their number of neighbours.
+    """
+    if neighbours is None or self.top_k <= 1:
+      return []
+    neighbours = neighbours.ravel()
+    max_neighbours = float(max(neighbours))
+    order = sorted(range(len(rects)), key=lambda i: neighbours[i], reverse=True)
+    order = [i for i in order if i != index][:self.top_k - 1]
+    return [(rects[i], prob * neighbours[i] / max_neighbours) for i in order]
+
+  def outlier(self, face_pos):
+    """
+    Register an outlier and try to get a valid hand position from
+    the previous frame
+    """
+    self.kb.update((None, face_pos))
+    f = self.kb.get_last_frame()
+    if not f:
+      return HandPos()
+    hand_pos, face = f
+    return HandPos(pos=hand_pos)
+
+  def scheduled(self):
+    """
+    Check if the cascades should run on the current frame.
+    They only run on every n-th frame to keep the cost per frame low.
+    """
+    self.frames_since_detect += 1
+    if self.frames_since_detect >= self.detect_interval:
+      self.frames_since_detect = 0
+      return True
+    return False
+
+  def interpolate(self):
+    """
+    Estimate the hand position for a frame without cascade detection
+    from the movement between the last detections.
+    """
+    steps = self.frames_since_detect / float(self.detect_interval)
+    hand_pos = self.kb.interpolate(steps)
+    if hand_pos == None:
+      return HandPos()
+    prob = self.kb.get_confidence() * self.interpolation_decay ** self.frames_since_detect
     return HandPos(pos=hand_pos, prob=prob, outline=Outline.RECT)
 
+  def get_pyramid(self, frame):
+    """
+    Scale the equalized grayscale image down
+    to the pyramid level used for detection.
+    """
+    pyramid = [frame.gray_equalized()]
+    for i in range(self.pyramid_level):
+      pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+  def search(self, window, min_size, max_size):
+    """
+    Search a window of the image (or the whole image if window is None)
+    on the selected pyramid level.
+    All coordinates are given and returned in full image resolution.
+    """
+    img = self.pyramid[self.pyramid_level]
+    scale = 2 ** self.pyramid_level
+    min_size = (min_size[0] // scale, min_size[1] // scale)
+    max_size = (max_size[0] // scale, max_size[1] // scale)
+    x1, y1 = 0, 0
+    if window != None:
+      x1, y1, x2, y2 = [c // scale for c in window]
+      img = img[y1:y2, x1:x2]
+
+    rects, neighbours = self.find(img, min_size, max_size)
+    if len(rects) != 0:
+      # Convert back to full image coordinates
+      rects[:,:2] += (x1, y1)
+      rects *= scale
+    return rects, neighbours
+
+  def find(self, img, min_size, max_size):
+    """
+    Run the cascades on an image.
+    The next cascade only runs if the previous one found nothing.
+    Returns rectangles as [x, y, width, height] and their number of
+    neighbours (None, if only one hypothesis is needed).
+    """
+    for classifier in self.classifiers:
+      if self.top_k > 1:
+        rects, neighbours = self.find_grouped(classifier, img, min_size, max_size)
+      else:
+        rects = classifier.detectMultiScale(img, scaleFactor=1.2,
+                  minNeighbors=self.confidence, minSize=min_size,
+                  maxSize=max_size, flags = cv.CV_HAAR_DO_CANNY_PRUNING |cv.CV_HAAR_SCALE_IMAGE)
+        neighbours = None
+      if len(rects) != 0:
+        # We found a result.
+        # Don't run other classifier
+        break
+    return rects, neighbours
+
+  def find_grouped(self, classifier, img, min_size, max_size):
+    """
+    Get the raw detections and group them ourselves
+    (like detectMultiScale does internally) to keep the
+    number of neighbours of each rectangle.
+    """
+    raw = classifier.detectMultiScale(img, scaleFactor=1.2,
+            minNeighbors=0, minSize=min_size,
+            maxSize=max_size, flags = cv.CV_HAAR_DO_CANNY_PRUNING |cv.CV_HAAR_SCALE_IMAGE)
+    if len(raw) == 0:
+      return (), None
+    rects, neighbours = cv2.groupRectangles(raw.tolist(), self.confidence, self.group_eps)
+    if len(rects) == 0:
+      return (), None
+    return rects, neighbours
+
+  def detect_full(self):
+    """
+    Search the whole image for hands of any size
+    """
+    self.frames_since_scan = 0
+    return self.search(None, self.min_hand_size, self.max_hand_size)
+
+  def detect_roi(self):
+    """
+    Search an expanded window around the last hand position
+    for hands of roughly the same size.
+    """
+    hand_pos, face = self.kb.get_last_frame()
+    height, width = self.pyramid[0].shape[:2]
+    # Center the window on the expected position if we know it
+    center = self.hint if self.hint is not None else hand_pos
+    window = rectangle.resize(center, self.roi_expand)
+    x1, y1, x2, y2 = rectangle.clip(window, width, height)
+
+    # Narrow the size band around the last hand size
+    w = hand_pos[2] - hand_pos[0]
+    h = hand_pos[3] - hand_pos[1]
+    min_size = (max(self.min_hand_size[0], int(w / self.roi_size_tolerance)),
+                max(self.min_hand_size[1], int(h / self.roi_size_tolerance)))
+    max_size = (min(self.max_hand_size[0], int(w * self.roi_size_tolerance)),
+                min(self.max_hand_size[1], int(h * self.roi_size_tolerance)))
+
+    return self.search([x1, y1, x2, y2], min_size, max_size)
+
+  def tracking(self):
+    """
+    Check if we are confident enough about the last hand
+    position to restrict the search to its surrounding.
+    """
+    if not self.roi_tracking:
+      return False
+    if self.frames_since_scan >= self.full_scan_interval:
+      # Regularly look at the whole image to find a better match
+      return False
+    f = self.kb.get_last_frame()
+    if not f or f[0] is None:
+      return False
+    return self.kb.get_confidence() >= self.min_tracking_conf
+
   def train(self, img):
     """
     Train the detector with a special test image. This improves the following
@@ -2,19 +2,87 @@ import cv2
 import rectangle
 from hand_pos import Outline, HandPos
 from bench import benchmark
+from template_bank import Template, TemplateBank
+from multiprocessing.pool import ThreadPool
 import numpy as np
+import threading
 import logging
 
+# Worker threads for template matching. Shared by all shape detectors,
+# so a detector created after a reset doesn't start new threads.
+match_pool = None
+match_pool_lock = threading.Lock()
+
+def get_match_pool(size):
+  global match_pool
+  with match_pool_lock:
+    if match_pool is None:
+      match_pool = ThreadPool(size)
+    return match_pool
+
+class Match(object):
+  """
+  Result of matching a single template
+  """
+  def __init__(self, key, template):
+    self.key = key
+    self.template = template
+    # Normalized match result (possibly downscaled)
+    self.result = None
+    self.result_scale = 1
+    # Best location in the match result
+    self.resultLoc = None
+    # Best location in the image
+    self.matchLoc = None
+    self.minVal = 0.0
+    self.maxVal = 0.0
+    self.conf = 0.0
+
 class DetectorShape:
   """
   A detector which matches a given shape (needle) to a part of a larger image (haystack).
   This detector needs no warmup over many frames; just a single
   image -- called template -- which will be the shape to search for.
+  To follow changes of hand scale and appearance, it keeps a bank of
+  templates (several scales and recent matches) and uses the best one.
   """
 
   def __init__(self, config, img = None, roi = None, match_method = cv2.TM_CCOEFF):
     self.config = config
     self.match_method = match_method
+
+    # Return up to k hypotheses (local maxima of the match result)
+    self.top_k = 3
+    # Minimum normalized match value of further hypotheses
+    self.min_candidate_score = 0.8
+
+    # Coarse-to-fine matching: Find the template on a downscaled image
+    # (1: half size, 2: quarter size, 0: disabled), then refine the
+    # position at full resolution in a small window.
+    self.coarse_level = 1
+    # Margin of the refinement window around the coarse match
+    # (in pixels of the downscaled image)
+    self.refine_margin = 4
+    # Templates smaller than this are not scaled down
+    self.min_coarse_size = 8
+    # Only use every n-th value (in both directions) of the match
+    # result to estimate the confidence
+    self.confidence_sample_step = 4
+
+    # Template bank
+    self.bank = TemplateBank(capacity = 6)
+    # Scales of the initial template
+    self.template_scales = [1.0, 0.8, 1.25]
+    # Add the current match as new template every few frames,
+    # if we are confident enough that it shows the hand
+    self.learn_interval = 30
+    self.learn_min_prob = 0.8
+    self.frames_since_learn = 0
+    # Match templates concurrently
+    self.pool = get_match_pool(self.bank.capacity)
+    # Downscaled image for coarse matching
+    self.coarse_img = None
+
     if img != None and roi != None:
       # Create template from given image
       self.create_template(img, roi)
@@ -24,7 +92,7 @@ class DetectorShape:
 
   def create_template(self, img, roi):
     """
-    Create a template image to match
+    Create template images to match
     """
     x0, y0, x1, y1 = roi
     # Copy template region to new image
@@ -36,75 +104,220 @@ class DetectorShape:
     #template = cv2.GaussianBlur(template,(3,3),0)
     self.set_template(template)
 
+    # Same template at other scales
+    height, width = template.shape[:2]
+    for scale in self.template_scales:
+      if scale == 1.0:
+        continue
+      size = (int(width * scale), int(height * scale))
+      if min(size) < self.min_coarse_size:
+        continue
+      self.add_template(cv2.resize(template, size), "scale {0}".format(scale))
+
   def set_template(self, template):
     """
     Set template image (needle), which we will search in the video capture
-    (haystack)
+    (haystack). This replaces all other templates.
+    """
+    self.bank.clear()
+    self.add_template(template, "initial")
+
+  def add_template(self, template, label):
     """
-    self.templ = template
-    # Precalculate template size
-    self.templ_w, self.templ_h = self.templ.shape[:2]
+    Add a preprocessed template image to the bank
+    """
+    self.bank.add(Template(template, self.coarse_level, self.min_coarse_size, label))
 
-  def preprocess(self, img):
+  def preprocess(self, frame):
     """
     The preprocessing step prepares the image to improve detection probability.
     """
-    # Make a copy of the image
-    self.img = img.copy()
     # Consider only red channel for template matching
-    self.img = self.img[:,:,2]
+    self.img = frame.red()
     # Remove noise
     #self.img = cv2.GaussianBlur(self.img,(3,3),0)
     self.img = self.img - cv2.erode(self.img, None)
 
   #@benchmark
-  def detect(self, img, face_pos):
+  def detect(self, frame, face_pos, hint = None):
     """
     Returns a needle hypothesis and the confidence that it is correct.
+    The expected hand position (hint) is not used by this detector.
+    """
+    self.preprocess(frame)
+
+    best = self.match_all()
+    if best == None:
+      return HandPos()
+    self.bank.win(best.key)
+
+    # Create a rectangle containing the hand
+    templ_height, templ_width = best.template.shape
+    x1 = best.matchLoc[0]
+    y1 = best.matchLoc[1]
+    x2 = x1 + templ_width
+    y2 = y1 + templ_height
+
+    needle_rect = [x1, y1, x2, y2]
+
+    prob = best.conf
+    logging.debug("Shape: Confidence %s (template %s)", prob, best.template.label)
+    candidates = self.get_candidates(best, prob)
+    self.learn(needle_rect, prob)
+
+    return HandPos(pos=needle_rect, prob=prob, candidates=candidates)
+
+  def match_all(self):
+    """
+    Match all templates of the bank and return the most confident match.
     """
-    # Do the Matching and Normalize
+    # Downscale the image once for all templates
+    self.coarse_img = self.img
+    for i in range(self.coarse_level):
+      self.coarse_img = cv2.pyrDown(self.coarse_img)
 
-    self.preprocess(img)
+    height, width = self.img.shape[:2]
+    matches = []
+    for key, template in self.bank.items():
+      templ_height, templ_width = template.shape
+      if templ_height <= height and templ_width <= width:
+        matches.append(Match(key, template))
 
-    self.result = cv2.matchTemplate(self.img, self.templ, self.match_method)
-    cv2.normalize(self.result, self.result, 0, 1, cv2.NORM_MINMAX)
+    if len(matches) > 1:
+      self.pool.map(self.match_template, matches)
+    else:
+      for m in matches:
+        self.match_template(m)
+
+    if not matches:
+      return None
+    return max(matches, key=lambda m: m.conf)
+
+  def match_template(self, m):
+    """
+    Match a single template, coarse-to-fine if possible
+    """
+    if self.coarse_level > 0 and m.template.coarse is not None:
+      self.match_coarse(m)
+    else:
+      self.match_full(m)
+    m.conf = self.get_confidence(m)
+
+  def match(self, m, img, templ):
+    """
+    Do the Matching and Normalize.
+    Returns the best location in the match result.
+    """
+    m.result = cv2.matchTemplate(img, templ, self.match_method)
+    cv2.normalize(m.result, m.result, 0, 1, cv2.NORM_MINMAX)
 
     # Localizing the best match with minMaxLoc
-    self.minVal, self.maxVal, self.minLoc, self.maxLoc = cv2.minMaxLoc(self.result)
+    m.minVal, m.maxVal, minLoc, maxLoc = cv2.minMaxLoc(m.result)
 
     # For SQDIFF and SQDIFF_NORMED, the best matches are lower values. For all the other methods, the higher the better
-    if self.match_method  == cv2.TM_SQDIFF or self.match_method == cv2.TM_SQDIFF_NORMED:
-      self.matchLoc = self.minLoc
-      #loc = np.where(result == result.min())
+    if self.sqdiff():
+      return minLoc
     else:
-      self.matchLoc = self.maxLoc
-      #loc = np.where(result == result.max())
+      return maxLoc
 
-    # Create a rectangle containing the hand
-    x1 = self.matchLoc[0]
-    y1 = self.matchLoc[1]
-    x2 = x1 + self.templ_h
-    y2 = y1 + self.templ_w
+  def match_full(self, m):
+    """
+    Match the template on the full resolution image
+    """
+    m.result_scale = 1
+    m.resultLoc = self.match(m, self.img, m.template.img)
+    m.matchLoc = m.resultLoc
 
-    #for pt in zip(*loc[::-1]):
-    #  if result[pt[::-1]] < 0.4:
-    #    continue
+  def match_coarse(self, m):
+    """
+    Match the downscaled template on the downscaled image
+    and refine the location at full resolution.
+    """
+    img = self.coarse_img
+    m.result_scale = 2 ** self.coarse_level
+    m.resultLoc = self.match(m, img, m.template.coarse)
 
-    needle_rect = [x1, y1, x2, y2]
+    # Refinement window around the coarse match
+    height, width = self.img.shape[:2]
+    templ_height, templ_width = m.template.shape
+    x = m.resultLoc[0] * m.result_scale
+    y = m.resultLoc[1] * m.result_scale
+    margin = self.refine_margin * m.result_scale
+    x0 = max(0, x - margin)
+    y0 = max(0, y - margin)
+    x1 = min(width, x + templ_width + margin)
+    y1 = min(height, y + templ_height + margin)
+    window = self.img[y0:y1, x0:x1]
+
+    if window.shape[0] < templ_height or window.shape[1] < templ_width:
+      # Too close to the border. Stick with the coarse result
+      m.matchLoc = (x, y)
+      return
+
+    fine = cv2.matchTemplate(window, m.template.img, self.match_method)
+    minVal, maxVal, minLoc, maxLoc = cv2.minMaxLoc(fine)
+    loc = minLoc if self.sqdiff() else maxLoc
+    m.matchLoc = (x0 + loc[0], y0 + loc[1])
+
+  def sqdiff(self):
+    return self.match_method == cv2.TM_SQDIFF or self.match_method == cv2.TM_SQDIFF_NORMED
+
+  def learn(self, rect, prob):
+    """
+    Remember the current appearance of the hand as a new template
+    """
+    self.frames_since_learn += 1
+    if self.frames_since_learn < self.learn_interval or prob < self.learn_min_prob:
+      return
+    self.frames_since_learn = 0
+    x1, y1, x2, y2 = rect
+    self.add_template(self.img[y1:y2, x1:x2].copy(), "appearance")
+
+  def get_candidates(self, m, prob):
+    """
+    Find further matches besides the best one.
+    Non-maximum suppression: After taking a peak from the match result,
+    clear its surrounding (half the template size) and take the next one.
+    """
+    if self.top_k <= 1:
+      return []
 
-    prob = self.get_confidence()
+    sqdiff = self.sqdiff()
+    result = m.result.copy()
+    # The match result might be downscaled (coarse matching)
+    scale = m.result_scale
+    templ_height, templ_width = m.template.shape
+    dx = templ_width // (2 * scale)
+    dy = templ_height // (2 * scale)
 
-    return HandPos(pos=needle_rect, prob=prob)
+    candidates = []
+    x, y = m.resultLoc
+    for i in range(self.top_k - 1):
+      # Suppress the previous peak
+      result[max(0, y - dy):y + dy + 1, max(0, x - dx):x + dx + 1] = 1 if sqdiff else 0
+      minVal, maxVal, minLoc, maxLoc = cv2.minMaxLoc(result)
+      if sqdiff:
+        score = 1 - minVal
+        x, y = minLoc
+      else:
+        score = maxVal
+        x, y = maxLoc
+      if score < self.min_candidate_score:
+        break
+      rect = [x * scale, y * scale, x * scale + templ_width, y * scale + templ_height]
+      candidates.append((rect, prob * score))
+    return candidates
 
-  def get_confidence(self):
+  def get_confidence(self, m):
     """
     Probabilty to for correct hand position.
     """
-    median = np.median(self.result)
+    # A sample is good enough and much faster than the full median
+    step = max(1, self.confidence_sample_step // m.result_scale)
+    median = np.median(m.result[::step, ::step])
     #logging.debug("Shape: Median %s", median)
-    #logging.debug("Shape: Min %s Max %s", self.minVal, self.maxVal)
-    conf = (self.maxVal - median)/(self.maxVal)
-    logging.debug("Shape: Confidence %s", conf)
+    #logging.debug("Shape: Min %s Max %s", m.minVal, m.maxVal)
+    conf = (m.maxVal - median)/(m.maxVal)
     return conf
 
   def train(self, img):
@@ -3,9 +3,17 @@ import rectangle
 from hand import Hand
 import numpy as np
 import geom
-from bench import benchmark
+from bench import benchmark, profiler
+from skin_lut import SkinLUT
 import logging
 
+class Segmentation(object):
+  """
+  Methods to separate skin from background
+  """
+  HSV = 1 # Convert to HSV and check thresholds
+  LUT = 2 # Lookup quantized BGR colors in a precalculated table
+
 class DetectorSkin:
   """
   Hand extraction using HSV based skin detection.
@@ -36,6 +44,31 @@ class DetectorSkin:
     # (or slightly below, when it comes to the thumb)
     self.finger_orientation_thresh = -20
 
+    # Check all convexity defects at once with numpy
+    self.vectorized_fingers = True
+
+    # Skin segmentation method
+    self.segmentation = Segmentation.HSV
+    self.skin_lut = SkinLUT(bits = 5)
+
+    # Structuring elements by size
+    self.kernels = {}
+    # Reusable output images for noise removal
+    self.buffers = {}
+    # Use a single opening instead of erode and dilate
+    # if both have the same size
+    self.fuse_morphology = True
+
+    # Only trace the outer contour of the largest skin blob
+    # instead of the full contour tree, unless the tree is needed.
+    self.fast_contours = True
+    # The full contour tree is needed for drawing the skin contours
+    # (set by the Detector depending on the output)
+    self.contour_tree = True
+    # Simplify the hand contour (only in fast contour mode)
+    self.approx_contour = False
+    self.approx_epsilon = 0.1
+
   def filter_skin(self, hsv):
     # Use default values...
     #filter_im = cv2.inRange(hsv, np.array((0., 60., 32.)), np.array((180., 255., 255.)))
@@ -51,24 +84,66 @@ class DetectorSkin:
     filter_im = cv2.inRange(hsv, LOWER, UPPER)
     return filter_im
 
+  def filter_skin_lut(self, img):
+    """
+    Get skin from a BGR image without color conversion.
+    The lookup table follows the thresholds in the config.
+    """
+    self.skin_lut.update(self.config)
+    return self.skin_lut.apply(img)
+
   def remove_noise(self, contours_img):
     """
     Improve contours image for better postprocessing
     """
+    smooth = self.config["smooth"]
+    erode  = self.config["erode"]
+    dilate = self.config["dilate"]
+    shape  = contours_img.shape
+
     # Smooth to get rid of some false positives
-    if self.config["smooth"] > 0:
-      contours_img = cv2.blur(contours_img, (self.config["smooth"], self.config["smooth"]))
+    if smooth > 0:
+      dst = self.get_buffer("smooth", shape)
+      cv2.blur(contours_img, (smooth, smooth), dst=dst)
+      contours_img = dst
     # Emphasize contours
-    if self.config["erode"] > 0:
-      contours_img = cv2.erode(contours_img, 
-                  cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                  (self.config["erode"], self.config["erode"])))
-    if self.config["dilate"] > 0:
-      contours_img = cv2.dilate(contours_img, 
-                  cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                  (self.config["dilate"], self.config["dilate"])))
+    if self.fuse_morphology and erode > 0 and erode == dilate:
+      # Erode followed by dilate is an opening
+      dst = self.get_buffer("morph", shape)
+      cv2.morphologyEx(contours_img, cv2.MORPH_OPEN, self.get_kernel(erode), dst=dst)
+      return dst
+    if erode > 0:
+      dst = self.get_buffer("erode", shape)
+      cv2.erode(contours_img, self.get_kernel(erode), dst=dst)
+      contours_img = dst
+    if dilate > 0:
+      dst = self.get_buffer("dilate", shape)
+      cv2.dilate(contours_img, self.get_kernel(dilate), dst=dst)
+      contours_img = dst
     return contours_img
 
+  def get_kernel(self, size):
+    """
+    Get an elliptic structuring element of the given size
+    """
+    if size not in self.kernels:
+      self.kernels[size] = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+    return self.kernels[size]
+
+  def get_buffer(self, name, shape):
+    """
+    Get a contiguous 8-bit image of the given shape.
+    The memory is reused between frames and only grows
+    if the region of interest gets bigger.
+    """
+    height, width = shape[:2]
+    size = height * width
+    buf = self.buffers.get(name)
+    if buf is None or buf.size < size:
+      buf = np.empty(size, np.uint8)
+      self.buffers[name] = buf
+    return buf[:size].reshape(height, width)
+
   def crop(self, img, roi):
     """
     Crop an image
@@ -79,42 +154,49 @@ class DetectorSkin:
     self.offset = (x1, y1)
     return img[y1:y2,x1:x2]
 
-  def preprocess(self, img, roi):
+  def preprocess(self, frame, roi):
     """
     The preprocessing step prepares the image to improve detection probability.
     """
-    img = self.crop(img, roi)
+    img = self.crop(frame.img, roi)
     # Set image proportions
     self.img_width, self.img_height = img.shape[:2]
 
-    # Convert to hsv
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
     # Get skin and improve result
-    filtered = self.filter_skin(hsv)
+    if self.segmentation == Segmentation.LUT:
+      filtered = self.filter_skin_lut(frame.bgr(roi))
+    else:
+      filtered = self.filter_skin(frame.hsv(roi))
     filtered = self.remove_noise(filtered)
     #cv2.imshow("Skin", filtered)
     return filtered
 
   #@benchmark
-  def detect(self, img, roi):
+  def detect(self, frame, roi):
     """
     Find hand object (fingers, contours) in region of interest
     """
     try:
       # Only consider region of interest
-      img = self.preprocess(img, roi)
+      with profiler.span("segmentation"):
+        img = self.preprocess(frame, roi)
       # Detect hand contour
-      contours, hierarchy = self.get_contours_approx(img)
-      hand_cnt, hand_area = self.get_max_contour(contours)
+      with profiler.span("contours"):
+        if self.fast_contours and not self.contour_tree:
+          hand_cnt, hand_area = self.get_hand_contour(img)
+          contours, hierarchy = self.get_contour_tree(hand_cnt)
+        else:
+          contours, hierarchy = self.get_contours_approx(img)
+          hand_cnt, hand_area = self.get_max_contour(contours)
 
       # Calculate defects of convex hull which are interpreted as fingers
       fingers = []
       if hand_cnt != None:
-        hand_hull = cv2.convexHull(hand_cnt,returnPoints = False)
-        defects = self.get_defects(hand_cnt, hand_hull)
+        with profiler.span("fingers"):
+          hand_hull = cv2.convexHull(hand_cnt,returnPoints = False)
+          defects = self.get_defects(hand_cnt, hand_hull)
 
-        fingers = self.get_fingers(hand_cnt, defects)
+          fingers = self.get_fingers(hand_cnt, defects)
 
       return Hand({
         "contours"        : contours,
@@ -133,6 +215,9 @@ class DetectorSkin:
     """
     Analyze the convexity defects and extract finger information
     """
+    if self.vectorized_fingers:
+      return self.get_fingers_vectorized(hand_cnt, defects)
+
     fingers = [] # Lines from the tip of a finger to the palm
     for i in range(defects.shape[0]):
       defect = defects[i,0]
@@ -141,6 +226,40 @@ class DetectorSkin:
         fingers.append(finger)
     return fingers
 
+  def get_fingers_vectorized(self, hand_cnt, defects):
+    """
+    Same as get_fingers, but all defects are checked in one go.
+    """
+    if defects is None or len(defects) == 0:
+      return []
+
+    defects = defects[:,0]
+    points = hand_cnt[:,0]
+    start = points[defects[:,0]]
+    end   = points[defects[:,1]]
+    far   = points[defects[:,2]]
+    depth = defects[:,3]
+
+    # Proportions of potential fingers
+    proportion = depth / float(self.img_width)
+    valid = (self.min_finger_len < proportion) & (proportion < self.max_finger_len)
+    # Finger orientation
+    valid &= (far[:,1] - start[:,1] > self.finger_orientation_thresh) & \
+             (far[:,1] - end[:,1]   > self.finger_orientation_thresh)
+    # Angles between fingers
+    a = geom.angles(far, start, end)
+    with np.errstate(invalid="ignore"):
+      valid &= (self.min_finger_angle < a) & (a < self.max_finger_angle)
+
+    offset = self.offset
+    fingers = []
+    for s, e, f in zip(start[valid], end[valid], far[valid]):
+      start_pt = (s[0] + offset[0], s[1] + offset[1])
+      far_pt   = (f[0] + offset[0], f[1] + offset[1])
+      end_pt   = (e[0] + offset[0], e[1] + offset[1])
+      fingers.append([(start_pt, far_pt), (far_pt, end_pt)])
+    return fingers
+
   def get_finger(self, hand_cnt, defect):
     """
     Calculate the two lines from the tip to the bottom of a finger
@@ -189,6 +308,26 @@ class DetectorSkin:
       cnt = cv2.approxPolyDP(cnt,0.1*cv2.arcLength(cnt,True),True)
     return contours, hierarchy
 
+  def get_hand_contour(self, img):
+    """
+    Get the outer contour of the largest skin blob.
+    Holes are not traced (RETR_EXTERNAL).
+    """
+    contours, hierarchy = cv2.findContours(img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    hand_cnt, hand_area = self.get_max_contour(contours)
+    if hand_cnt is not None and self.approx_contour:
+      epsilon = self.approx_epsilon * cv2.arcLength(hand_cnt, True)
+      hand_cnt = cv2.approxPolyDP(hand_cnt, epsilon, True)
+    return hand_cnt, hand_area
+
+  def get_contour_tree(self, cnt):
+    """
+    Contour list and hierarchy for drawing a single contour
+    """
+    if cnt is None:
+      return [], None
+    return [cnt], np.array([[[-1, -1, -1, -1]]], np.int32)
+
   def get_defects(self, cnt, hull):
     """
     Get convexity defects from a contour.
@@ -0,0 +1,254 @@
+"""
+Asynchronous execution of keyboard commands.
+"""
+
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+from collections import deque
+
+import keyboard
+
+class Backend(object):
+  """
+  Executes input commands on behalf of the user.
+  A command is a tuple (name, args) where name is a method
+  of the backend, e.g. ("keyboard", ([], "F1")).
+  """
+  def run(self, commands):
+    """
+    Execute a batch of commands in order
+    """
+    for name, args in commands:
+      try:
+        getattr(self, name)(*args)
+      except Exception, e:
+        logging.exception("Dispatch: Error executing %s%s", name, args)
+
+class MacBackend(Backend):
+  """
+  Mac OS X keyboard control via AppleScript and PyKeyboard
+  """
+  def __init__(self):
+    # Only needed for this backend
+    from pykeyboard import PyKeyboard
+    self.k = PyKeyboard()
+
+  def command(self, app, cmd):
+    keyboard.mac_command(app, cmd)
+
+  def keyboard(self, modifiers, key):
+    keyboard.mac_keyboard(modifiers, key)
+
+  def press_key(self, key):
+    self.k.press_key(key)
+
+class WorkerBackend(Backend):
+  """
+  Sends batches of commands over a pipe to a long-lived worker process
+  instead of starting a new process for every command.
+
+  Protocol: One command per line. An empty line ends a batch.
+  The worker answers each batch with a single line (e.g. "ok").
+  By default, commands are written as JSON lists [name, arg1, ...].
+  """
+  def __init__(self, argv):
+    self.argv = argv
+    self.process = None
+
+  def start(self):
+    logging.info("Dispatch: Starting worker %s", " ".join(self.argv))
+    self.process = subprocess.Popen(self.argv,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+  def stop(self):
+    if self.process:
+      self.process.stdin.close()
+      self.process.wait()
+      self.process = None
+
+  def format(self, name, args):
+    """
+    Convert a command to a line for the worker
+    """
+    return json.dumps([name] + list(args))
+
+  def run(self, commands):
+    lines = []
+    for name, args in commands:
+      try:
+        lines.append(self.format(name, args))
+      except ValueError, e:
+        logging.warning("Dispatch: Dropping %s%s (%s)", name, args, e)
+    if not lines:
+      return
+    data = "\n".join(lines) + "\n\n"
+    try:
+      self.send(data)
+    except (IOError, OSError), e:
+      # The worker died. Try once more with a fresh one.
+      logging.warning("Dispatch: Worker failed (%s). Restarting.", e)
+      self.process = None
+      try:
+        self.send(data)
+      except (IOError, OSError), e:
+        # Worker can't be started (e.g. missing interpreter). Give up on this batch.
+        logging.error("Dispatch: Worker failed again (%s). Dropping %d commands.", e, len(lines))
+        self.process = None
+
+  def send(self, data):
+    if self.process == None or self.process.poll() != None:
+      self.start()
+    self.process.stdin.write(data)
+    self.process.stdin.flush()
+    reply = self.process.stdout.readline()
+    if not reply:
+      raise IOError("Worker closed the connection")
+    if reply.strip() != "ok":
+      logging.warning("Dispatch: Worker reported %s", reply.strip())
+
+class MacWorkerBackend(WorkerBackend):
+  """
+  Mac OS X keyboard control through a single AppleScript interpreter
+  """
+  def __init__(self, script = "workers/osa_worker.js"):
+    WorkerBackend.__init__(self, ["/usr/bin/osascript", "-l", "JavaScript", script])
+
+  def format(self, name, args):
+    if name == "command":
+      app, cmd = args
+      return keyboard.mac_tell(app, cmd)
+    if name == "keyboard":
+      modifiers, key = args
+      return keyboard.mac_tell("System Events", keyboard.mac_keyboard_script(modifiers, key))
+    if name == "press_key":
+      key, = args
+      return keyboard.mac_tell("System Events", "key code %d" % key)
+    raise ValueError("Unknown command %s" % name)
+
+def echo_backend(logfile = None):
+  """
+  Worker backend with a stub script which only logs the commands.
+  Runs on any platform (e.g. for tests).
+  """
+  argv = [sys.executable, "workers/echo_worker.py"]
+  if logfile:
+    argv.append(logfile)
+  return WorkerBackend(argv)
+
+class RecordingBackend(Backend):
+  """
+  Stand-in backend which only records the commands (e.g. for tests)
+  """
+  def __init__(self):
+    self.commands = []
+
+  def run(self, commands):
+    self.commands.extend(commands)
+
+class Dispatcher(object):
+  """
+  Queue commands and execute them in a background thread,
+  so the frame loop never waits for the operating system.
+
+  Redundant commands are coalesced: An idempotent command (e.g. key down)
+  is dropped if it is the same as the last queued command.
+  Keystrokes are limited to one per min_interval seconds.
+  """
+  def __init__(self, backend = None, min_interval = 0.1):
+    self.backend = backend if backend else MacWorkerBackend()
+    self.min_interval = min_interval
+    # Commands which are subject to rate limiting
+    self.rate_limited = ["keyboard", "press_key"]
+    # Commands which have no further effect when repeated
+    # (Action uses them for key down and key up)
+    self.idempotent = ["command"]
+    # Time of last submission for each rate limited command
+    self.last_submit = {}
+
+    self.queue = deque()
+    self.cond = threading.Condition()
+    # True while the backend executes a batch
+    self.busy = False
+
+    # Statistics
+    self.num_submitted = 0
+    self.num_coalesced = 0
+
+    self.thread = threading.Thread(target=self.run, name="Dispatcher")
+    self.thread.daemon = True
+    self.thread.start()
+
+  def submit(self, name, *args):
+    """
+    Queue a command for execution.
+    Returns False if the command was dropped.
+    """
+    command = (name, args)
+    with self.cond:
+      if self.redundant(command) or self.too_frequent(command):
+        self.num_coalesced += 1
+        return False
+      self.queue.append(command)
+      self.num_submitted += 1
+      self.cond.notify_all()
+      return True
+
+  def redundant(self, command):
+    """
+    Check if the same idempotent command is queued just before.
+    Earlier ones may not be dropped (e.g. key down, key up, key down)
+    """
+    name, args = command
+    return name in self.idempotent and bool(self.queue) and self.queue[-1] == command
+
+  def too_frequent(self, command):
+    """
+    Check if the same keystroke was sent just before
+    """
+    name, args = command
+    if name not in self.rate_limited:
+      return False
+    key = repr(command)
+    now = time.time()
+    if now - self.last_submit.get(key, 0) < self.min_interval:
+      return True
+    self.last_submit[key] = now
+    return False
+
+  def run(self):
+    """
+    Execute all queued commands as a batch
+    """
+    while True:
+      with self.cond:
+        while not self.queue:
+          self.cond.wait()
+        batch = list(self.queue)
+        self.queue.clear()
+        self.busy = True
+      try:
+        self.backend.run(batch)
+      except Exception, e:
+        # Keep the dispatcher alive. Commands of this batch are lost.
+        logging.exception("Dispatch: Backend failed. Dropping %d commands", len(batch))
+      with self.cond:
+        self.busy = False
+        self.cond.notify_all()
+
+  def flush(self, timeout = 1.0):
+    """
+    Wait until all queued commands have been executed.
+    Returns False on timeout.
+    """
+    end = time.time() + timeout
+    with self.cond:
+      while self.queue or self.busy:
+        remaining = end - time.time()
+        if remaining <= 0:
+          return False
+        self.cond.wait(remaining)
+    return True
@@ -3,6 +3,94 @@ Primitives to draw on images using OpenCV
 """
 
 import cv2
+import numpy as np
+import logging
+import rectangle
+
+class Overlay(object):
+  """
+  Collects everything that is drawn on a frame and composites it
+  in one go. Filled contours are blended with the image, but only
+  within their bounding box. The blending buffer is kept between frames.
+  Lines and rectangles are drawn opaque on top.
+  A shape which can't be drawn is skipped. All others are still drawn.
+  """
+  def __init__(self, opacity = 0.7):
+    self.opacity = opacity
+    self.buffer = None
+    self.clear()
+
+  def clear(self):
+    # Filled contours: (contours, hierarchy, color, offset)
+    self.fills = []
+    # Opaque shapes: (function, args)
+    self.shapes = []
+
+  def contours(self, contours, hierarchy, color, offset = (0,0)):
+    if len(contours):
+      self.fills.append((contours, hierarchy, color, offset))
+
+  def rect(self, rect, color, thickness = 2):
+    self.shapes.append((draw_rect, (rect, color, thickness)))
+
+  def ellipse(self, box, color, thickness = 2):
+    self.shapes.append((cv2.ellipse, (box, color, thickness)))
+
+  def lines(self, lines, color):
+    self.shapes.append((draw_lines, (lines, color)))
+
+  def cross(self, point, color = (0,0,255)):
+    self.shapes.append((cross, (point, color)))
+
+  def compose(self, img):
+    """
+    Draw all collected shapes on img and start a new frame
+    """
+    if self.fills:
+      self.blend(img)
+    for function, args in self.shapes:
+      try:
+        function(img, *args)
+      except Exception, e:
+        logging.exception("Draw: Can't draw %s%s", function.__name__, args)
+    self.clear()
+
+  def blend(self, img):
+    if self.buffer is None or self.buffer.shape != img.shape:
+      self.buffer = np.empty_like(img)
+    height, width = img.shape[:2]
+    fills, boxes = [], []
+    for fill in self.fills:
+      contours, hierarchy, color, offset = fill
+      try:
+        boxes.append(contours_bbox(contours, offset))
+        fills.append(fill)
+      except Exception, e:
+        logging.exception("Draw: Can't draw contours")
+    if not boxes:
+      return
+    x1, y1 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    x2, y2 = max(b[2] for b in boxes), max(b[3] for b in boxes)
+    x1, y1, x2, y2 = rectangle.clip([x1, y1, x2, y2], width, height)
+    if x2 <= x1 or y2 <= y1:
+      return
+    # Only the bounding box of the buffer needs to be up to date
+    self.buffer[y1:y2, x1:x2] = img[y1:y2, x1:x2]
+    for contours, hierarchy, color, offset in fills:
+      try:
+        cv2.drawContours(self.buffer, contours, -1, color, -1, 8, hierarchy, 1, offset)
+      except Exception, e:
+        logging.exception("Draw: Can't draw contours")
+    roi = img[y1:y2, x1:x2]
+    cv2.addWeighted(self.buffer[y1:y2, x1:x2], self.opacity, roi, 1 - self.opacity, 0, roi)
+
+def contours_bbox(contours, offset = (0,0)):
+  """
+  Bounding box [x1, y1, x2, y2] of a list of contours
+  """
+  x, y, w, h = cv2.boundingRect(np.concatenate([c.reshape(-1, 2) for c in contours]))
+  ox, oy = offset
+  return [x + ox, y + oy, x + ox + w, y + oy + h]
 
 def draw_contours(img, contours, hierarchy, color, opacity=1, offset = (0,0)):
   """
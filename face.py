@@ -2,6 +2,8 @@ import cv, cv2
 import rectangle
 from numpy import concatenate
 import logging
+import threading
+import Queue
 
 class Face(object):
   def __init__(self, config = {}):
@@ -31,36 +33,165 @@ class Face(object):
     # since we last did a face detection
     self.frames_passed = 0
 
-  def positions(self, img):
+    # Redetect earlier if the image changes around a known face.
+    # Motion is measured on a downscaled grayscale image.
+    self.motion_check = True
+    self.motion_scale = 0.25
+    # Search area around a face for the motion check (relative to face size)
+    self.motion_margin = 0.25
+    # Mean absolute gray value difference which counts as motion
+    self.motion_threshold = 12
+    # Downscaled image at the time of the last face detection
+    self.reference = None
+
+    # If there is no face, rescan after scan_interval frames.
+    # The interval doubles with each empty scan (up to max_scan_interval)
+    self.min_scan_interval = 1
+    self.max_scan_interval = 32
+    self.scan_interval = self.min_scan_interval
+
+    # Run the cascades on a downscaled grayscale copy of the frame
+    self.detect_scale = 0.5
+    # Detect faces in a background thread. The results are used as soon
+    # as they are ready (usually one frame late).
+    self.asynchronous = True
+    self.worker = None
+    # Holds at most one image. A new scan is only requested when
+    # the worker is idle.
+    self.jobs = Queue.Queue(1)
+    self.results_lock = threading.Lock()
+    self.results = None
+    self.pending = False
+
+  def positions(self, frame):
     """
     Get all faces in an  image.
     Also apply some padding to remove the area next to the faces.
     This improves both, performance and robustness of the hand search.
     """
     self.frames_passed += 1
+    if self.asynchronous:
+      self.collect()
 
     # Speedup. Only redetect after a certain delay.
-    if self.faces_invalid():
-      self.recalculate(img)
+    if self.faces_invalid(frame):
+      img = self.downscale(frame.gray(), self.detect_scale)
+      if self.asynchronous:
+        self.request(img)
+      else:
+        self.recalculate(img)
     return self.face_positions
 
-  def faces_invalid(self):
+  def request(self, img):
+    """
+    Hand a downscaled grayscale image to the face detection worker.
+    Does nothing if the worker is still busy with the previous image.
+    """
+    if self.pending:
+      return
+    if self.worker is None:
+      self.worker = threading.Thread(target=self.run, name="Face")
+      self.worker.daemon = True
+      self.worker.start()
+    logging.debug("Face detector: Scanning...")
+    # Reset the frame counter
+    self.frames_passed = 0
+    self.pending = True
+    self.jobs.put(img)
+
+  def run(self):
+    """
+    Face detection worker
+    """
+    while True:
+      img = self.jobs.get()
+      if img is None:
+        break
+      try:
+        rects = self.detect(img)
+      except Exception, e:
+        logging.exception("Face detector: Scan failed")
+        rects = []
+      with self.results_lock:
+        self.results = (rects, img)
+
+  def collect(self):
+    """
+    Use the results of the worker if there are new ones
+    """
+    with self.results_lock:
+      results = self.results
+      self.results = None
+    if results is None:
+      return
+    self.pending = False
+    rects, img = results
+    self.update(rects, img)
+
+  def stop(self):
+    if self.worker is not None:
+      self.jobs.put(None)
+      self.worker.join()
+      self.worker = None
+
+  def faces_invalid(self, frame = None):
     """
     Check if we can still use the old face positions or
     if the delay is over and we need to find the face again in the image.
     """
     if not self.face_positions:
-      # No previous face detection. Declare invalid.
-      return True
+      # No previous face detection. Scan again, but less often
+      # the longer the scene stays empty.
+      return self.frames_passed >= self.scan_interval
     if self.frames_passed > self.face_delay:
       # The delay has passed. Invalidate previous detection
       return True
+    if frame is not None and self.faces_moved(frame):
+      # Something happens around the face. Don't trust the old position.
+      logging.debug("Face detector: Motion around face")
+      return True
     # Everything ok. We can use the old detection.
     return False
 
+  def faces_moved(self, frame):
+    """
+    Compare the image around the known faces
+    with the image at the time of the detection.
+    """
+    if not self.motion_check or self.reference is None:
+      return False
+    small = self.downscale(frame.gray(), self.motion_scale)
+    if small.shape != self.reference.shape:
+      return True
+    height, width = small.shape[:2]
+    for face in self.face_positions:
+      x1, y1, x2, y2 = self.motion_area(face, width, height)
+      if x2 <= x1 or y2 <= y1:
+        continue
+      diff = cv2.absdiff(small[y1:y2, x1:x2], self.reference[y1:y2, x1:x2])
+      if cv2.mean(diff)[0] > self.motion_threshold:
+        return True
+    return False
+
+  def motion_area(self, face, width, height):
+    """
+    Face rectangle plus margin in the downscaled image
+    """
+    x1, y1, x2, y2 = [int(c * self.motion_scale) for c in face]
+    dx = int((x2 - x1) * self.motion_margin)
+    dy = int((y2 - y1) * self.motion_margin)
+    return rectangle.clip([x1 - dx, y1 - dy, x2 + dx, y2 + dy], width, height)
+
+  def downscale(self, gray, scale):
+    if scale == 1.0:
+      return gray.copy()
+    return cv2.resize(gray, None, fx=scale, fy=scale,
+        interpolation=cv2.INTER_AREA)
+
   def recalculate(self, img):
     """
     Try to redetect the face position.
+    img is the downscaled grayscale frame.
     """
     logging.debug("Face detector: Scanning...")
     # Reset the frame counter
@@ -69,28 +200,53 @@ class Face(object):
     self.face_positions = None
 
     rects = self.detect(img)
+    self.update(rects, img)
+
+  def update(self, rects, img):
+    """
+    Store the faces found in the downscaled image img
+    """
+    # Back to full resolution
+    rects = [[int(c / self.detect_scale) for c in r] for r in rects]
     for r in rects:
       x1, y1, x2, y2 = r
       logging.info("Face detector: Found face at %s", r)
     if rects != None:
       self.face_positions = rects
 
+    if self.face_positions:
+      self.scan_interval = self.min_scan_interval
+      if self.motion_check:
+        self.reference = self.downscale(img, self.motion_scale / self.detect_scale)
+    else:
+      # Nobody there. Back off.
+      self.scan_interval = min(self.scan_interval * 2, self.max_scan_interval)
+      self.reference = None
+
   def detect(self, img):
     """
     Find blobs which match a given HAAR cascade.
     """
-    #gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    #gray = cv2.equalizeHist(gray)
+    gray = cv2.equalizeHist(img)
 
-    # Accumulate all detections in a list
-    r = self.detect_frontal(img) + self.detect_profile(img)
+    # The profile cascade is only needed if there is no frontal face
+    r = self.detect_frontal(gray)
+    if not r:
+      r = self.detect_profile(gray)
     return r
 
+  def min_size(self):
+    """
+    Minimum face size in the downscaled image
+    """
+    w, h = self.config["min_face_size"]
+    return (int(w * self.detect_scale), int(h * self.detect_scale))
+
   def detect_frontal(self, img):
     rects_frontal = self.cascade_frontal.detectMultiScale(img,
       scaleFactor=1.1,
       minNeighbors=self.config["haar_confidence"],
-      minSize=self.config["min_face_size"])
+      minSize=self.min_size())
 
     if len(rects_frontal) != 0:
       # We found a frontal faces.
@@ -104,7 +260,7 @@ class Face(object):
     rects_profile = self.cascade_profile.detectMultiScale(img, 
       scaleFactor=1.2,
       minNeighbors=self.config["haar_confidence"],
-      minSize=self.config["min_face_size"])
+      minSize=self.min_size())
 
     if len(rects_profile) != 0:
       # OK, found profile faces.
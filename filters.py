@@ -7,13 +7,15 @@ class Filters(object):
   Filters are used to adjust the settings during runtime.
   """
 
-  def __init__(self, config):
+  def __init__(self, config, show = True):
     # Config dictionary
     self.config = dict()
 
     # Config file
     self.current_config = config
     self.winname = ""
+    # Show trackbars (disable for headless use)
+    self.show = show
 
     # Load settings file, but don't update trackbar yet
     self.load(False)
@@ -22,7 +24,8 @@ class Filters(object):
     # The more ticks, the more accurate the value can be adjusted.
     self.float_scale = 10
 
-    self.show_filters()
+    if self.show:
+      self.show_filters()
 
   def show_filters(self):
     """
@@ -148,7 +151,7 @@ class Filters(object):
       logging.info("Loading %s..." % (self.current_config))
       self.config.update(pickle.load(open(self.current_config, "r")))
       logging.info(self.config)
-      if update:
+      if update and self.show:
         self.update_trackbar()
 
     except Exception, e:
@@ -0,0 +1,157 @@
+"""
+Derived image planes of a single frame.
+"""
+
+import cv2
+import threading
+import numpy as np
+import rectangle
+
+class FrameContext(object):
+  """
+  Holds the input image of the current frame and lazily computes
+  derived planes (HSV, grayscale, red channel) on first request.
+  Each conversion happens at most once per frame, no matter how
+  many detectors ask for it.
+
+  Planes can be requested for the full image or for a region of
+  interest (roi = [x1, y1, x2, y2]). If the full plane was already
+  computed, a roi is just a view into it.
+
+  The input image is never modified (it is also shown to the user).
+  Detectors get a read-only view of it. Erased regions (i.e. faces)
+  are only blacked out in the derived planes, which are new images
+  anyway. A masked copy of the input is only made on request.
+  """
+  def __init__(self, img):
+    self.img = img.view()
+    self.img.flags.writeable = False
+    # Erased regions [x1, y1, x2, y2]
+    self.masked = []
+    # Computed planes by (name, roi)
+    self.planes = {}
+    # Position detectors run concurrently.
+    # Make sure no plane is computed twice.
+    self.lock = threading.Lock()
+    self.plane_locks = {}
+
+    self.converters = {
+      "hsv"            : lambda img: cv2.cvtColor(img, cv2.COLOR_BGR2HSV),
+      "gray"           : lambda img: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY),
+      "red"            : lambda img: np.ascontiguousarray(img[:,:,2]),
+      # Masked copy of the input
+      "bgr"            : lambda img: img.copy(),
+      # Equalization depends on the whole input,
+      # so it is computed from the gray plane of the same region.
+      "gray_equalized" : None
+    }
+
+  def hsv(self, roi = None):
+    return self.get("hsv", roi)
+
+  def gray(self, roi = None):
+    return self.get("gray", roi)
+
+  def gray_equalized(self, roi = None):
+    return self.get("gray_equalized", roi)
+
+  def red(self, roi = None):
+    return self.get("red", roi)
+
+  def bgr(self, roi = None):
+    """
+    The input image (or a region of interest) without the erased regions.
+    This is a read-only view unless the region contains erased parts.
+    """
+    img = self.source(roi)
+    if not self.mask_regions(roi, img.shape):
+      return img
+    return self.get("bgr", roi)
+
+  def source(self, roi = None):
+    """
+    Read-only view of the unmodified input image
+    """
+    if roi is None:
+      return self.img
+    x1, y1, x2, y2 = roi
+    return self.img[y1:y2, x1:x2]
+
+  def get(self, name, roi = None):
+    """
+    Get a derived plane. Compute it, if necessary.
+    """
+    key = self.get_key(roi)
+    plane = self.lookup(name, key)
+    if plane is not None:
+      return plane
+
+    with self.get_lock(name, key):
+      # Another thread might have been faster
+      plane = self.lookup(name, key)
+      if plane is not None:
+        return plane
+      plane = self.convert(name, roi)
+      self.planes[(name, key)] = plane
+      return plane
+
+  def get_key(self, roi):
+    if roi is None:
+      return None
+    return tuple([int(c) for c in roi])
+
+  def lookup(self, name, key):
+    """
+    Find a cached plane. A region of interest can also
+    be cut out of a cached full plane.
+    """
+    plane = self.planes.get((name, key))
+    if plane is not None or key == None:
+      return plane
+    full = self.planes.get((name, None))
+    if full is None:
+      return None
+    x1, y1, x2, y2 = key
+    return full[y1:y2, x1:x2]
+
+  def get_lock(self, name, key):
+    with self.lock:
+      return self.plane_locks.setdefault((name, key), threading.Lock())
+
+  def convert(self, name, roi):
+    if name == "gray_equalized":
+      # The gray plane is already masked
+      return cv2.equalizeHist(self.gray(roi))
+    plane = self.converters[name](self.source(roi))
+    for x1, y1, x2, y2 in self.mask_regions(roi, plane.shape):
+      plane[y1:y2, x1:x2] = 0
+    return plane
+
+  def mask_regions(self, roi, shape):
+    """
+    Erased regions in the coordinates of a region of interest
+    (or the full image) with the given shape
+    """
+    if not self.masked:
+      return []
+    ox, oy = (0, 0) if roi is None else roi[:2]
+    height, width = shape[:2]
+    regions = []
+    for x1, y1, x2, y2 in self.masked:
+      r = rectangle.clip([x1 - ox, y1 - oy, x2 - ox, y2 - oy], width, height)
+      if r[2] > r[0] and r[3] > r[1]:
+        regions.append(r)
+    return regions
+
+  def erase(self, rect):
+    """
+    Black out a region in all full planes.
+    Cached regions of interest and equalized planes are dropped.
+    """
+    x1, y1, x2, y2 = rect
+    self.masked.append([x1, y1, x2, y2])
+    for (name, key) in list(self.planes.keys()):
+      if key == None and name != "gray_equalized":
+        self.planes[(name, key)][y1:y2, x1:x2] = 0
+      else:
+        del self.planes[(name, key)]
@@ -2,6 +2,7 @@
 Geometrical helper functions
 """
 
+import numpy as np
 from numpy import sqrt, arccos, rad2deg
 
 def distance(p1, p2):
@@ -23,3 +24,16 @@ def angle(cent, line1, line2):
   angle = arccos((sum(map(lambda a, b:a*b, v1, v2))) / (dist(v1) * dist(v2)))
   angle = rad2deg(angle)
   return angle
+
+def angles(cent, line1, line2):
+  """
+  Calculate the angles between many pairs of lines at once.
+  All parameters are arrays of points with shape (N, 2).
+  Degenerate lines (zero length) yield nan.
+  """
+  v1 = (line1 - cent).astype(np.float64)
+  v2 = (line2 - cent).astype(np.float64)
+  dot = np.sum(v1 * v2, axis=1)
+  norm = np.sqrt(np.sum(v1 ** 2, axis=1)) * np.sqrt(np.sum(v2 ** 2, axis=1))
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return rad2deg(arccos(dot / norm))
@@ -36,7 +36,7 @@ class Gesture:
   def add_hand(self, hand):
     """
     New hand properties (position, shape) have been detected.
-    Update hand history
+    Update hand history (hand is a HandRecord)
     """
     self.hands.append(hand)
     # Only keep the last few hands
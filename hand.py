@@ -2,26 +2,49 @@ class Hand(object):
   """
   Store all hand properties (position, shape) inside an object.
   """
-  def __init__(self, features = {}):
-    defaults = {
-      "contour"         : None,  # Outer hand contour
-      "contours"        : None,  # All hand contours
-      "contours_offset" : (0,0), # Offset for contours in image (used for drawing)
-      "hierarchy"       : None,  # Hierarchy of contours
-      "area"            : 0,     # Hand area in image
-      "hull"            : 0,     # Convex hulls from contours recognized in image
-      "fingers"         : [],    # Lines to highlight fingers in contours
-      "num_fingers"     : 0,     # Fingers shown
-      "positions"       : {}     # Dict of hand positions as reported by the detectors
-    }
+  __slots__ = ("contour", "contours", "contours_offset", "hierarchy", "area",
+               "hull", "fingers", "num_fingers", "positions", "pos")
 
-    # Set default config
-    for key in defaults:
-      setattr(self, key, defaults[key])
+  def __init__(self, features = None):
+    # Set defaults
+    self.contour         = None  # Outer hand contour
+    self.contours        = None  # All hand contours
+    self.contours_offset = (0,0) # Offset for contours in image (used for drawing)
+    self.hierarchy       = None  # Hierarchy of contours
+    self.area            = 0     # Hand area in image
+    self.hull            = 0     # Convex hulls from contours recognized in image
+    self.fingers         = []    # Lines to highlight fingers in contours
+    self.num_fingers     = 0     # Fingers shown
+    self.positions       = {}    # Dict of hand positions as reported by the detectors
+    self.pos             = {}    # Hand positions of the frame (set by the Detector)
 
     # Modify with available parameters
-    for key in features:
-      setattr(self, key, features[key])
+    if features:
+      for key in features:
+        setattr(self, key, features[key])
+
+  def record(self):
+    """
+    Compact summary of this hand for the history
+    """
+    estimate = self.pos.get("estimate")
+    if estimate is None:
+      return HandRecord(num_fingers=self.num_fingers, area=self.area)
+    return HandRecord(estimate.pos, estimate.prob, self.num_fingers, self.area)
+
+class HandRecord(object):
+  """
+  The part of a hand which is kept in the history:
+  The estimated position (rectangle) with its probability
+  and the hand features. Contours are not kept alive.
+  """
+  __slots__ = ("estimate", "prob", "num_fingers", "area")
+
+  def __init__(self, estimate = None, prob = 0.0, num_fingers = 0, area = 0):
+    self.estimate    = estimate
+    self.prob        = prob
+    self.num_fingers = num_fingers
+    self.area        = area
 
 if __name__ == "__main__":
   # TEST
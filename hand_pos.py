@@ -9,20 +9,19 @@ class HandPos(object):
   """
   Each position detector returns a HandPos object,
   with the following fields:
-  - detector_name - The name of the filter which was used
-  - rect - The position of the hand represented as a rectangle
+  - pos - The position of the hand represented as a rectangle
   - prob - The probabilty that the position is correct
+  - outline - Shape of pos (rectangle or ellipse)
+  - candidates - Further hypotheses as (rect, prob) tuples
   """
-  def __init__(self, **kwargs):
-    defaults = {
-      "pos"     : None,
-      "prob"    : 0.0,
-      "outline" : Outline.RECT,
-    }
+  __slots__ = ("pos", "prob", "outline", "candidates")
 
-    # Set default config
-    for key in defaults:
-      setattr(self, key, defaults[key])
+  def __init__(self, **kwargs):
+    # Set defaults
+    self.pos        = None
+    self.prob       = 0.0
+    self.outline    = Outline.RECT
+    self.candidates = []
 
     # Modify with available parameters
     for key in kwargs:
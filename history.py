@@ -0,0 +1,110 @@
+"""
+Fixed-size frame history with typed columns.
+"""
+
+import time
+import numpy as np
+
+class History(object):
+  """
+  Ring buffer of per-frame records, stored in a numpy structured array.
+  Appending overwrites the oldest record and never allocates.
+  Records are addressed like a list (0 is the oldest, -1 the newest).
+
+  Columns:
+  - timestamp - Time when the frame was added
+  - rect - Hand position [x1, y1, x2, y2] (only meaningful if valid)
+  - valid - False if there was no hand position (outlier)
+  - prob - Probability of the hand position
+  - fingers - Number of fingers
+  - area - Hand area
+  - face - True if a face was found in the frame
+  """
+  dtype = np.dtype([
+    ("timestamp", np.float64),
+    ("rect",      np.int32, (4,)),
+    ("valid",     np.bool_),
+    ("prob",      np.float32),
+    ("fingers",   np.int16),
+    ("area",      np.float32),
+    ("face",      np.bool_)
+  ])
+
+  def __init__(self, capacity = 10):
+    self.capacity = capacity
+    self.data = np.zeros(capacity, self.dtype)
+    # Position of the next record
+    self.head = 0
+    self.count = 0
+
+  def append(self, rect = None, prob = 0.0, fingers = 0, area = 0, face = False, timestamp = None):
+    row = self.data[self.head]
+    row["timestamp"] = time.time() if timestamp is None else timestamp
+    row["valid"] = rect is not None
+    row["rect"] = rect if rect is not None else 0
+    row["prob"] = prob
+    row["fingers"] = fingers
+    row["area"] = area
+    row["face"] = face
+    self.head = (self.head + 1) % self.capacity
+    self.count = min(self.count + 1, self.capacity)
+
+  def clear(self):
+    self.head = 0
+    self.count = 0
+
+  def __len__(self):
+    return self.count
+
+  def index(self, i):
+    """
+    Position of the i-th record in the buffer
+    """
+    if i < 0:
+      i += self.count
+    if i < 0 or i >= self.count:
+      raise IndexError("History index out of range")
+    return (self.head - self.count + i) % self.capacity
+
+  def __getitem__(self, i):
+    return self.data[self.index(i)]
+
+  def rect(self, i):
+    """
+    Hand position of the i-th record as a list (None for outliers)
+    """
+    row = self.data[self.index(i)]
+    if not row["valid"]:
+      return None
+    return row["rect"].tolist()
+
+  def window(self, n = None):
+    """
+    The last n records (all if n is None) in chronological order
+    """
+    if n is None or n > self.count:
+      n = self.count
+    indices = (self.head - n + np.arange(n)) % self.capacity
+    return self.data[indices]
+
+  def column(self, name, n = None):
+    return self.window(n)[name]
+
+  def overlaps(self, n = None):
+    """
+    Overlap of each hand position in the last n records with its
+    predecessor, relative to its own area (see rectangle.intersect_percentage).
+    Returns n - 1 values. Outliers don't overlap with anything.
+    """
+    w = self.window(n)
+    if len(w) < 2:
+      return np.zeros(0)
+    current, father = w["rect"][1:], w["rect"][:-1]
+    left   = np.maximum(current[:,0], father[:,0])
+    top    = np.maximum(current[:,1], father[:,1])
+    right  = np.minimum(current[:,2], father[:,2])
+    bottom = np.minimum(current[:,3], father[:,3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area = (current[:,2] - current[:,0]) * (current[:,3] - current[:,1])
+    valid = w["valid"][1:] & w["valid"][:-1] & (area > 0)
+    return np.where(valid, intersection / np.maximum(area, 1).astype(np.float64), 0.0)
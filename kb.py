@@ -1,19 +1,19 @@
+from history import History
+
 class KB(object):
   """
   Knowledge base for all detectors.
   """
   def __init__(self, history_length = 10):
-    # The history is a simple sequence of frames
-    KB.history = []
+    # The history is a ring buffer of compact frame records
+    self.history = History(history_length)
     self.max_history = history_length
 
-  def update(self, frame):
+  def update(self, record):
     """
-    Store frame in knowledge base
+    Store frame (a HandRecord) in knowledge base
     """
-    KB.history.append(frame)
-    # Only keep the last few frames
-    KB.history = KB.history[-self.max_history:]
+    self.history.append(record.estimate, record.prob, record.num_fingers, record.area)
 
   def reset(self):
-    KB.history = []
+    self.history.clear()
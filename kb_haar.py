@@ -1,4 +1,4 @@
-import rectangle
+from history import History
 
 class HaarKB(object):
   """
@@ -6,14 +6,16 @@ class HaarKB(object):
   Only collect information for this specific detector here.
   """
   def __init__(self, history_length = 10, min_overlapping = 0.7):
-    # The history is a simple sequence of frames
-    self.history = []
+    # The history is a ring buffer of hand positions
+    # and face detection flags
+    self.history = History(history_length)
     self.max_history = history_length
     self.min_overlapping = min_overlapping
 
   def update(self, frame):
     """
-    Store new frame and make sanity checks.
+    Store new frame (hand_pos, face_pos) and make sanity checks.
+    hand_pos is None for outliers.
     """
     self.add_frame(frame)
 
@@ -29,17 +31,7 @@ class HaarKB(object):
     if len(self.history) < 3:
       return True
 
-    current = self.history[-1]
-    father = self.history[-2]
-
-    if current == None or father == None:
-      return True
-
-    # Unpack the hand from the frames
-    current_hand, current_face = current
-    father_hand, father_face   = father
-
-    overlapping = rectangle.intersect_percentage(current_hand, father_hand)
+    overlapping = self.history.overlaps(2)[-1]
     return overlapping >= self.min_overlapping
 
   def too_many_outliers(self):
@@ -51,10 +43,7 @@ class HaarKB(object):
       return False
     # Frames must intersect by a certain percentage to
     # be valid. Only one outlier is allowed.
-    current = self.history[-1]
-    father = self.history[-2]
-    # Check if we have more than one outlier
-    return current == None and father == None
+    return not self.history.column("valid", 2).any()
 
   def get_last_frame(self):
     """
@@ -64,15 +53,32 @@ class HaarKB(object):
     """
     if len(self.history) < 1:
       return None
-    return self.history[-1]
+    return (self.history.rect(-1), bool(self.history[-1]["face"]))
+
+  def interpolate(self, steps):
+    """
+    Extrapolate the hand position from the movement between
+    the last two valid frames. steps is the fraction of the distance
+    between these frames to move further.
+    Returns None if there is no valid hand position.
+    """
+    if len(self.history) < 1:
+      return None
+    current_hand = self.history.rect(-1)
+    if current_hand is None:
+      return None
+    if len(self.history) < 2 or self.history.rect(-2) is None:
+      return current_hand
+
+    father_hand = self.history.rect(-2)
+    return [int(c + (c - f) * steps) for c, f in zip(current_hand, father_hand)]
 
   def add_frame(self, frame):
     """
     Store frame in knowledge base
     """
-    self.history.append(frame)
-    # Only keep the last few frames
-    self.history = self.history[-self.max_history:]
+    hand_pos, face_pos = frame
+    self.history.append(hand_pos, face = bool(face_pos))
 
   def conf_face_detect(self):
     """
@@ -80,17 +86,14 @@ class HaarKB(object):
     """
     if len(self.history) == 0:
       return 0.0
-
-    f = self.faces_found() / float(len(self.history))
-    return f
+    return float(self.history.column("face").mean())
 
   def faces_found(self):
     """
     Count the number of detected faces in the
     frame history.
     """
-    num_faces = sum([1 for (h,f) in self.history if f])
-    return num_faces
+    return int(self.history.column("face").sum())
 
   def conf_hand_detect(self):
     """
@@ -147,7 +150,7 @@ class HaarKB(object):
     return max([0, conf])
 
   def reset(self):
-    self.history = []
+    self.history.clear()
 
 if __name__ == "__main__":
   # Test
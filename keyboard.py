@@ -13,10 +13,22 @@ def mac_command(app, cmd):
       '-e', 'end tell']
   return os.spawnv(os.P_WAIT, scriptcmd[0], scriptcmd)
 
+def mac_tell(app, cmd):
+  """
+  Single line AppleScript statement which sends a command to an application
+  """
+  return 'tell application "%s" to %s' % (app, cmd)
+
 def mac_keyboard(modifiers, key):
   """
   A simple AppleScript keyboard wrapper
   """
+  return mac_command("System Events", mac_keyboard_script(modifiers, key))
+
+def mac_keyboard_script(modifiers, key):
+  """
+  AppleScript command for a key press with modifiers
+  """
   # Create key-down events for modifiers
   mod_keys = [mod + " down" for mod in modifiers]
 
@@ -38,9 +50,7 @@ def mac_keyboard(modifiers, key):
 
     send_key = "keystroke " + key
 
-  # Make the call
-  cmd = '%s using {%s}' % (send_key, ", ".join(mod_keys))
-  return mac_command("System Events", cmd)
+  return '%s using {%s}' % (send_key, ", ".join(mod_keys))
 
 def test():
   """
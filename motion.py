@@ -0,0 +1,76 @@
+"""
+Motion model for the estimated hand position.
+"""
+
+import numpy as np
+
+class AlphaBetaFilter(object):
+  """
+  Constant velocity model of a rectangle.
+  The state is the center and the size of the rectangle
+  together with their change per frame.
+  Measurements are smoothed, and the position in the next frame
+  can be predicted, even if there is no measurement.
+  """
+  def __init__(self, alpha = 0.5, beta = 0.2, max_misses = 5):
+    # Weight of a new measurement for position and velocity
+    self.alpha = alpha
+    self.beta = beta
+    # Number of frames without measurement until the track is lost
+    self.max_misses = max_misses
+    self.reset()
+
+  def reset(self):
+    # [center x, center y, width, height]
+    self.state = None
+    self.velocity = np.zeros(4)
+    self.misses = 0
+
+  def update(self, rect):
+    """
+    Add a measurement and return the smoothed rectangle
+    """
+    z = self.to_state(rect)
+    if self.state is None:
+      self.state = z
+      self.velocity = np.zeros(4)
+    else:
+      predicted = self.state + self.velocity
+      residual = z - predicted
+      self.state = predicted + self.alpha * residual
+      self.velocity = self.velocity + self.beta * residual
+    self.misses = 0
+    return self.to_rect(self.state)
+
+  def miss(self):
+    """
+    No measurement in this frame. Move on with the current velocity.
+    Returns the predicted rectangle or None if the track is lost.
+    """
+    if self.state is None:
+      return None
+    if self.misses >= self.max_misses:
+      self.reset()
+      return None
+    self.state = self.state + self.velocity
+    self.misses += 1
+    return self.to_rect(self.state)
+
+  def predict(self):
+    """
+    Expected rectangle in the next frame (or None)
+    """
+    if self.state is None:
+      return None
+    return self.to_rect(self.state + self.velocity)
+
+  def to_state(self, rect):
+    x1, y1, x2, y2 = rect
+    return np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0, x2 - x1, y2 - y1], np.float64)
+
+  def to_rect(self, state):
+    cx, cy, w, h = state
+    w = max(0.0, w)
+    h = max(0.0, h)
+    rect = [cx - w / 2.0, cy - h / 2.0, cx + w / 2.0, cy + h / 2.0]
+    return [max(0, int(round(c))) for c in rect]
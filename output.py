@@ -1,4 +1,5 @@
 import cv2
+import time
 import datetime
 
 import draw
@@ -18,7 +19,10 @@ class Output(object):
       # Colorful output
       "rainbow_colors": False,
       # Store screenshots in separate directory
-      "screenshot_dir": "assets/screenshots/"
+      "screenshot_dir": "assets/screenshots/",
+      # Maximum frame rate of the preview window.
+      # None: Show every frame, 0: No preview (headless)
+      "preview_fps": None
     }
 
     # Set default config
@@ -48,24 +52,63 @@ class Output(object):
       "default": (self.colors["yellow"] , 4)
     }
 
+    # All shapes of a frame get composited at once
+    self.overlay = draw.Overlay(opacity = 0.7)
+
+    # Last rendered image (preallocated)
+    self.img = None
+    # Time of the last preview update
+    self.last_preview = 0
+
+  def preview_enabled(self):
+    """
+    Check if there is a preview window at all
+    """
+    return self.preview_fps != 0
+
+  def preview_due(self):
+    """
+    Check if the preview needs to be updated in this frame
+    """
+    if not self.preview_enabled():
+      return False
+    if self.preview_fps is None:
+      return True
+    now = time.time()
+    if now - self.last_preview < 1.0 / self.preview_fps:
+      return False
+    self.last_preview = now
+    return True
+
   def show(self, img, hand, reference_point = None):
     """
-    Create output with transparent image overlay
+    Create output with transparent image overlay.
+    Returns False if the preview was skipped in this frame.
     """
-    # Store current image
-    self.img = img
+    if not self.preview_due():
+      return False
+
+    # Draw on a copy. img belongs to the capture, which reuses it
+    # for later frames, and the shown image is kept for screenshots.
+    if self.img is None or self.img.shape != img.shape:
+      self.img = img.copy()
+    else:
+      self.img[:] = img
 
     # Output
     self.output_positions(hand)
     self.output_hand_contour(hand)
     self.output_reference_point(reference_point)
+    # Shapes which can't be drawn are skipped and logged
+    self.overlay.compose(self.img)
     cv2.imshow("Tracker", self.img)
+    return True
 
   def output_reference_point(self, ref):
     """
     Draw the reference point for mouse movement
     """
-    if ref: draw.cross(self.img, ref)
+    if ref: self.overlay.cross(ref)
 
   def output_positions(self, hand):
     """
@@ -108,9 +151,9 @@ class Output(object):
       return
     try:
       if outline == Outline.RECT:
-        draw.draw_rect(self.img, pos, color, thickness)
+        self.overlay.rect(pos, color, thickness)
       elif outline == Outline.ELLIPSE:
-        cv2.ellipse(self.img, pos, color, thickness)
+        self.overlay.ellipse(pos, color, thickness)
     except Exception, e:
       logging.exception("Output: Can't show result of %s", detector_name)
 
@@ -120,7 +163,7 @@ class Output(object):
     """
     try:
       if hand.contours != None and hand.hierarchy != None:
-        draw.draw_contours(self.img, hand.contours, hand.hierarchy, self.colors["blue"], 0.7, hand.contours_offset)
+        self.overlay.contours(hand.contours, hand.hierarchy, self.colors["blue"], hand.contours_offset)
         self.draw_fingers(hand)
       #if hand.contour != None:
       #  draw.draw_contour(self.img, hand.contour, self.colors["blue"], 0.7, hand.contours_offset)
@@ -133,7 +176,7 @@ class Output(object):
     Draw each finger.
     """
     for finger in hand.fingers:
-      draw.draw_lines(self.img, finger, self.colors["darkblue"])
+      self.overlay.lines(finger, self.colors["darkblue"])
 
   def toggle_estimate(self):
     """
@@ -154,6 +197,9 @@ class Output(object):
     self.show_skin = not self.show_skin
 
   def make_screenshot(self):
+    if self.img is None:
+      logging.warning("Output: No preview image for screenshot")
+      return
     timestamp = datetime.datetime.now() 
     filename = "{0}Screenshot {1}.jpg".format(self.screenshot_dir, timestamp)
     logging.info("Writing %s", filename)
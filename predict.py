@@ -25,16 +25,65 @@ def get_bins(rectangles):
         bins[i].append(rect2)
   return bins
 
-def positions_overlap(positions):
+def cluster_indices(rects, min_overlap = 0.5):
+  """
+  Group rectangles into clusters of overlapping rectangles.
+  Two rectangles are connected if one covers more than min_overlap
+  of the other. All pairwise overlaps are calculated at once and
+  connected rectangles are merged with union-find.
+  Returns lists of indices into rects.
+  """
+  rects = numpy.array(rects, numpy.float64).reshape(-1, 4)
+  n = len(rects)
+
+  # Pairwise intersections
+  left   = numpy.maximum(rects[:, None, 0], rects[None, :, 0])
+  top    = numpy.maximum(rects[:, None, 1], rects[None, :, 1])
+  right  = numpy.minimum(rects[:, None, 2], rects[None, :, 2])
+  bottom = numpy.minimum(rects[:, None, 3], rects[None, :, 3])
+  intersection = numpy.clip(right - left, 0, None) * numpy.clip(bottom - top, 0, None)
+
+  # Same as rectangle.intersect_percentage(r_i, r_j)
+  areas = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+  with numpy.errstate(divide="ignore", invalid="ignore"):
+    ratio = intersection / areas[:, None]
+  connected = (ratio > min_overlap) | (ratio.T > min_overlap)
+
+  # Union-find over the connected pairs
+  parent = list(range(n))
+  def find(i):
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+  for i, j in zip(*numpy.nonzero(numpy.triu(connected, 1))):
+    root_i, root_j = find(i), find(j)
+    if root_i != root_j:
+      parent[root_j] = root_i
+
+  clusters = {}
+  for i in range(n):
+    clusters.setdefault(find(i), []).append(i)
+  return clusters.values()
+
+def positions_overlap(positions, vectorized = True):
   """
   Get the largest set of overlapping rectangles.
+  Further hypotheses (candidates) of a detector only count if they
+  overlap with the position of another detector. Otherwise, a single
+  detector could agree with itself.
   """
   hands = positions.values()
   if len(hands) < 1:
     return []
 
   rectangles = []
-  for hand in hands:
+  # Detector index and main position flag for each rectangle
+  sources = []
+  for detector, hand in enumerate(hands):
+    if hand.pos is None:
+      # Detector missed the hand in this frame
+      continue
     if hand.outline == Outline.ELLIPSE:
       # Convert to rectangle to calculate intersections
       pos = rectangle.get_bounding_rect(hand.pos)
@@ -42,7 +91,28 @@ def positions_overlap(positions):
       pos = hand.pos
     # Store results for further analysis
     rectangles.append((pos, hand.prob))
+    sources.append((detector, True))
+    # Consider all other hypotheses of the detector, too
+    for r, p in hand.candidates:
+      if r is not None:
+        rectangles.append((r, p))
+        sources.append((detector, False))
+
+  if not rectangles:
+    return []
 
+  if vectorized:
+    clusters = []
+    for cluster in cluster_indices([r for r, p in rectangles]):
+      main = set([sources[i][0] for i in cluster if sources[i][1]])
+      clusters.append([rectangles[i] for i in cluster
+                       if sources[i][1] or main - set([sources[i][0]])])
+    return max(clusters, key=lambda c: len(c))
+
+  # Only the main positions
+  rectangles = [r for r, (detector, is_main) in zip(rectangles, sources) if is_main]
+  if not rectangles:
+    return []
   bins = get_bins(rectangles)
   max_bins = sorted(bins, key=lambda bin: len(bin), reverse=True)
   return max_bins[0]
@@ -53,18 +123,13 @@ def average_weighted(rects):
   Use the probability as a weight to build the average, e.g.
   avg = sum([prob*rect for rect,prob in rects]) / len(rects)
   """
-  sum_p = sum([p for r,p in rects])
-  products_x1 = [r[0]*p for r,p in rects]
-  products_y1 = [r[1]*p for r,p in rects]
-  products_x2 = [r[2]*p for r,p in rects]
-  products_y2 = [r[3]*p for r,p in rects]
-  avg_x1 = int(sum(products_x1) / sum_p)
-  avg_y1 = int(sum(products_y1) / sum_p)
-  avg_x2 = int(sum(products_x2) / sum_p)
-  avg_y2 = int(sum(products_y2) / sum_p)
-  r = [avg_x1, avg_y1, avg_x2, avg_y2]
+  coords = numpy.array([r for r,p in rects], numpy.float64).reshape(-1, 4)
+  probs = numpy.array([p for r,p in rects], numpy.float64)
+  sum_p = probs.sum()
+  avg = numpy.dot(probs, coords) / sum_p
+  r = [int(c) for c in avg]
   r = rectangle.offset(r, (0,-20))
-  avg_p = sum_p / len(rects)
+  avg_p = float(sum_p) / len(rects)
   return HandPos(pos=r, prob=avg_p)
 
 def max_prob(positions):
@@ -150,6 +150,17 @@ def resize(r, percentage):
   y2 = int(center_y + dy)
   return [x1, y1, x2, y2]
 
+def clip(r, width, height):
+  """
+  Limit a rectangle to the dimensions of an image
+  """
+  x1, y1, x2, y2 = r
+  x1 = min(max(0, x1), width)
+  x2 = min(max(0, x2), width)
+  y1 = min(max(0, y1), height)
+  y2 = min(max(0, y2), height)
+  return [x1, y1, x2, y2]
+
 def offset(r, offs):
   """
   Move rectangle
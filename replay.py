@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+Offline benchmark.
+
+Replays recorded footage (a video file or a directory of images)
+through the detection pipeline without opening any windows and
+reports latencies per stage as JSON.
+Several filter settings are replayed one after another,
+each in its own process.
+
+Example:
+  python replay.py assets/test_video/10.mov \
+    --filters filters/filters_default filters/filters_dark
+"""
+
+import cv2
+import sys
+import time
+import json
+import subprocess
+import argparse
+import logging
+import resource
+from os import listdir, path
+import numpy as np
+
+from filters import Filters
+from detector import Detector
+from gesture import Gesture
+from kb import KB
+
+def read_frames(source, width, height, flip = True, max_frames = None):
+  """
+  Generate frames from a video file or a directory of images.
+  Frames are resized (and mirrored) exactly like in the tracker.
+  """
+  if path.isdir(source):
+    files = sorted(listdir(source))
+    images = (cv2.imread(path.join(source, f)) for f in files)
+  else:
+    images = read_video(source)
+
+  count = 0
+  for img in images:
+    if img is None:
+      continue
+    if max_frames and count >= max_frames:
+      break
+    img = cv2.resize(img, (width, height))
+    if flip:
+      img = cv2.flip(img, 1)
+    count += 1
+    yield img
+
+def read_video(filename):
+  """
+  Generate all frames of a video file
+  """
+  video = cv2.VideoCapture(filename)
+  if not video.isOpened():
+    raise IOError("Can't open video {0}".format(filename))
+  while True:
+    ok, img = video.read()
+    if not ok:
+      break
+    yield img
+
+def percentiles(samples):
+  """
+  Latency statistics of a stage in milliseconds
+  """
+  if not samples:
+    return {}
+  ms = np.array(samples) * 1000.0
+  return {
+    "p50"  : float(np.percentile(ms, 50)),
+    "p95"  : float(np.percentile(ms, 95)),
+    "p99"  : float(np.percentile(ms, 99)),
+    "mean" : float(np.mean(ms)),
+    "max"  : float(np.max(ms))
+  }
+
+class Replay(object):
+  """
+  Feed recorded frames through Detector, KB and Gesture
+  and measure the time of each stage.
+  """
+  def __init__(self, source, filters_file, width = 341, height = 256,
+               flip = True, max_frames = None):
+    self.source = source
+    self.filters_file = filters_file
+    self.width = width
+    self.height = height
+    self.flip = flip
+    self.max_frames = max_frames
+
+    self.filters = Filters(filters_file, show = False)
+    self.detector = Detector(self.filters.config)
+    # Nothing is drawn. Same as the headless tracker.
+    self.detector.contour_tree = False
+    self.kb = KB()
+    self.gesture = Gesture()
+
+    self.stages = ["detect", "kb", "gesture", "total"]
+
+  def run(self):
+    """
+    Process all frames and return the report.
+    """
+    samples = dict((stage, []) for stage in self.stages)
+    frames = read_frames(self.source, self.width, self.height,
+                         self.flip, self.max_frames)
+    for img in frames:
+      t0 = time.time()
+      hand = self.detector.detect(img)
+      t1 = time.time()
+      # Same as Tracker.process: The history only keeps a compact record
+      record = hand.record()
+      self.kb.update(record)
+      t2 = time.time()
+      self.gesture.add_hand(record)
+      self.gesture.detect_gesture()
+      t3 = time.time()
+
+      samples["detect"].append(t1 - t0)
+      samples["kb"].append(t2 - t1)
+      samples["gesture"].append(t3 - t2)
+      samples["total"].append(t3 - t0)
+
+    return self.report(samples)
+
+  def report(self, samples):
+    num_frames = len(samples["total"])
+    total_time = sum(samples["total"])
+    return {
+      "source"  : self.source,
+      "filters" : self.filters_file,
+      "frames"  : num_frames,
+      "fps"     : num_frames / total_time if total_time else 0.0,
+      "stages"  : dict((stage, percentiles(samples[stage])) for stage in self.stages),
+      # Peak memory of the whole process so far.
+      # Only comparable between configs if each one runs in its own
+      # process (see run_isolated)
+      # (kilobytes on Linux, bytes on Mac OS X)
+      "max_rss" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+def run_isolated(args, filters_file):
+  """
+  Replay a single filter configuration in a separate process.
+  Memory statistics and detector threads don't carry over
+  from one configuration to the next.
+  """
+  argv = [sys.executable, path.abspath(__file__), args.source,
+          "--filters", filters_file,
+          "--width", str(args.width),
+          "--height", str(args.height)]
+  if not args.flip:
+    argv.append("--no-flip")
+  if args.max_frames:
+    argv.extend(["--max-frames", str(args.max_frames)])
+  reports = json.loads(subprocess.check_output(argv))
+  return reports[0]
+
+def main():
+  parser = argparse.ArgumentParser(description="Replay footage through the tracker pipeline")
+  parser.add_argument("source", help="Video file or directory of images")
+  parser.add_argument("--filters", nargs="+", default=["filters/filters_default"],
+                      help="Filter settings to compare")
+  parser.add_argument("--width", type=int, default=341)
+  parser.add_argument("--height", type=int, default=256)
+  parser.add_argument("--no-flip", dest="flip", action="store_false")
+  parser.add_argument("--max-frames", type=int, default=None)
+  parser.add_argument("--output", help="Write JSON report to file instead of stdout")
+  args = parser.parse_args()
+
+  reports = []
+  if len(args.filters) == 1:
+    replay = Replay(args.source, args.filters[0], args.width, args.height,
+                    args.flip, args.max_frames)
+    reports.append(replay.run())
+  else:
+    # Compare configurations on equal terms
+    for filters_file in args.filters:
+      reports.append(run_isolated(args, filters_file))
+
+  result = json.dumps(reports, indent=2, sort_keys=True)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(result)
+  else:
+    print result
+
+if __name__ == "__main__":
+  logging.basicConfig(format = '%(message)s', level = logging.WARNING)
+  main()
@@ -0,0 +1,47 @@
+"""
+Frame rate control for the main loop.
+"""
+
+import time
+
+class Scheduler(object):
+  """
+  Paces a loop to a target frame rate.
+  A frame is due every period() seconds. If processing falls behind,
+  the schedule starts anew instead of trying to catch up.
+  """
+  def __init__(self, fps = 0, min_period = 0):
+    # Target frames per second (0: as fast as possible)
+    self.fps = fps
+    # Minimum time between two frames in seconds
+    self.min_period = min_period
+    # Time when the next frame is due
+    self.next_time = None
+
+  def period(self):
+    period = self.min_period
+    if self.fps:
+      period = max(period, 1.0 / self.fps)
+    return period
+
+  def remaining(self):
+    """
+    Seconds until the next frame is due
+    """
+    if self.next_time is None:
+      return 0
+    return max(0, self.next_time - time.time())
+
+  def wait(self):
+    """
+    Sleep until the next frame is due
+    """
+    remaining = self.remaining()
+    if remaining > 0:
+      time.sleep(remaining)
+    now = time.time()
+    period = self.period()
+    if self.next_time is None or now - self.next_time > period:
+      # Too slow. Don't try to catch up.
+      self.next_time = now
+    self.next_time += period
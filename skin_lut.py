@@ -0,0 +1,55 @@
+"""
+Lookup table based skin segmentation.
+"""
+
+import cv2
+import numpy as np
+
+class SkinLUT(object):
+  """
+  Maps quantized BGR colors directly to a skin mask.
+  The table is calculated once from the HSV thresholds in the config
+  and only rebuilt when they change. Segmentation is then a single
+  lookup per pixel without any color conversion.
+  """
+  def __init__(self, bits = 5):
+    # Bits per color channel (5 bits -> 32^3 table entries)
+    self.bits = bits
+    self.table = None
+    self.thresholds = None
+
+  def update(self, config):
+    """
+    Rebuild the table if the skin thresholds have changed.
+    """
+    thresholds = (config["min_hue"], config["min_saturation"], config["min_darkness"],
+                  config["max_hue"], config["max_saturation"], config["max_darkness"])
+    if thresholds != self.thresholds:
+      self.thresholds = thresholds
+      self.table = self.build(thresholds[:3], thresholds[3:])
+
+  def build(self, lower, upper):
+    """
+    Classify the center color of each quantization bin.
+    """
+    n = 1 << self.bits
+    step = 256 >> self.bits
+    centers = np.arange(n) * step + step // 2
+    b, g, r = np.meshgrid(centers, centers, centers, indexing="ij")
+    bgr = np.column_stack((b.ravel(), g.ravel(), r.ravel()))
+    bgr = bgr.reshape(-1, 1, 3).astype(np.uint8)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    LOWER = np.array(lower, np.uint8)
+    UPPER = np.array(upper, np.uint8)
+    return cv2.inRange(hsv, LOWER, UPPER).ravel()
+
+  def apply(self, img):
+    """
+    Get skin mask of a BGR image
+    """
+    shift = 8 - self.bits
+    b = img[:,:,0] >> shift
+    g = img[:,:,1] >> shift
+    r = img[:,:,2] >> shift
+    index = (b.astype(np.intp) << (2 * self.bits)) | (g.astype(np.intp) << self.bits) | r
+    return self.table[index]
@@ -0,0 +1,66 @@
+"""
+A collection of hand templates for shape matching.
+"""
+
+import cv2
+import logging
+from collections import OrderedDict
+
+class Template(object):
+  """
+  A preprocessed template image and its downscaled version
+  for coarse matching (None if it would get too small).
+  """
+  def __init__(self, img, coarse_level = 0, min_coarse_size = 8, label = ""):
+    self.img = img
+    self.shape = img.shape[:2]
+    self.label = label
+    # Number of frames in which this template was the best match
+    self.wins = 0
+
+    self.coarse = img
+    for i in range(coarse_level):
+      self.coarse = cv2.pyrDown(self.coarse)
+    if min(self.coarse.shape[:2]) < min_coarse_size:
+      self.coarse = None
+
+class TemplateBank(object):
+  """
+  Holds several templates (different scales and recent appearances
+  of the hand). When the bank is full, the template which has not
+  been the best match for the longest time gets evicted.
+  """
+  def __init__(self, capacity = 6):
+    self.capacity = capacity
+    # Least recently winning template first
+    self.templates = OrderedDict()
+    self.next_key = 0
+
+  def add(self, template):
+    """
+    Store a template. Returns its key.
+    """
+    key = self.next_key
+    self.next_key += 1
+    self.templates[key] = template
+    while len(self.templates) > self.capacity:
+      evicted_key, evicted = self.templates.popitem(last=False)
+      logging.debug("Shape: Evicting template %s (%s wins)", evicted.label, evicted.wins)
+    return key
+
+  def win(self, key):
+    """
+    Mark a template as the best match of the current frame
+    """
+    template = self.templates.pop(key)
+    template.wins += 1
+    self.templates[key] = template
+
+  def items(self):
+    return self.templates.items()
+
+  def clear(self):
+    self.templates.clear()
+
+  def __len__(self):
+    return len(self.templates)
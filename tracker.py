@@ -30,6 +30,7 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 # External libraries
 import cv, cv2
 import time, threading, operator, math, datetime, errno
+import sys, os, select, argparse
 from os import listdir
 import colorsys
 from collections import namedtuple
@@ -49,6 +50,9 @@ import draw
 from kb import KB
 from action import Action, Actions
 from output import Output
+from capture import Capture
+from scheduler import Scheduler
+from bench import profiler
 
 class Tracker(object):
   """
@@ -60,20 +64,27 @@ class Tracker(object):
   known gesture.
   """
 
-  def __init__(self):
+  def __init__(self, headless = False, preview_fps = None, target_fps = 0, video = None):
     """
     Configuration
+
+    headless: Run without any window (same as preview_fps = 0). Keys are read from stdin.
+    preview_fps: Maximum rate of the preview window
+                 (None: every frame, 0: no preview; default for headless)
+    target_fps: Maximum processing rate (0: as fast as possible)
+    video: Read frames from a video file instead of the webcam
     """
 
     # Camera settings
     self.FRAME_WIDTH = 341
     self.FRAME_HEIGHT = 256
     self.flip_camera = True # Mirror image
-    self.camera = cv2.VideoCapture(1)
+    if video:
+      # ...you can also use a test video for input
+      self.camera = cv2.VideoCapture(video)
+    else:
+      self.camera = cv2.VideoCapture(1)
 
-    # ...you can also use a test video for input
-    #video = "/Users/matthiasendler/Code/snippets/python/tracker/final/assets/test_video/10.mov"
-    #self.camera = cv2.VideoCapture(video)
     #self.skip_input(400) # Skip to an interesting part of the video
 
     if not self.camera.isOpened():
@@ -82,12 +93,28 @@ class Tracker(object):
     #self.camera.set(cv2.cv.CV_CAP_PROP_FRAME_WIDTH, self.FRAME_WIDTH)
     #self.camera.set(cv2.cv.CV_CAP_PROP_FRAME_HEIGHT, self.FRAME_HEIGHT)
 
+    # Read frames in a separate thread.
+    # The main loop always processes the newest frame.
+    self.capture = Capture(self.camera, self.FRAME_WIDTH, self.FRAME_HEIGHT, self.flip_camera)
+    self.capture.start()
+
     self.filters_dir = "filters/" # Filter settings in trackbar
     self.filters_file = "filters_default"
 
     # Load filter settings
     current_config = self.filters_dir + self.filters_file
-    self.filters = Filters(current_config)
+    self.headless = headless
+    if preview_fps is None and headless:
+      preview_fps = 0
+    # Without a preview window there is no GUI at all:
+    # No trackbars, and keys are read from stdin.
+    self.gui = preview_fps != 0
+    self.filters = Filters(current_config, show = self.gui)
+
+    # Processing rate. wait_between_frames (ms) acts as a minimum period.
+    self.scheduler = Scheduler(target_fps)
+    # Keys are read from stdin if there is no preview window
+    self.stdin_closed = False
 
     # No actions will be triggered in test mode
     # (can be used to adjust settings at runtime)
@@ -105,10 +132,13 @@ class Tracker(object):
     self.gesture = Gesture()
 
     # The action module executes keyboard and mouse commands
-    self.action = Action()
+    self.action = Action(kb = self.kb)
 
     # Show output of detectors
-    self.output = Output()
+    self.output = Output(preview_fps = preview_fps)
+
+    # Log timing statistics periodically and on SIGUSR1
+    profiler.install_signal()
 
     self.run()
 
@@ -118,49 +148,102 @@ class Tracker(object):
     process it and react on it (e.g. with an action).
     """
     while True:
-      img = self.get_input()
-      hand = self.process(img)
-      ref = self.action.get_reference_point()
-      self.output.show(img, hand, ref)
+      # Idle time (pacing and key input) is not part of the frame
+      with profiler.span("wait"):
+        self.wait_input()
+      with profiler.span("frame"):
+        img = self.get_input()
+        if img is None:
+          # Camera closed or end of video
+          logging.info("Tracker: Capture stopped %s", self.capture.stats())
+          break
+        hand = self.process(img)
+        ref = self.action.get_reference_point()
+        with profiler.span("output"):
+          self.output.show(img, hand, ref)
+      profiler.maybe_report()
 
   def process(self, img):
     """
     Process input
     """
-    # Run detection
-    hand = self.detector.detect(img)
-    # Store result in knowledge base
-    self.kb.update(hand)
+    # Run detection.
+    # Skin contours are only traced completely if they are shown.
+    self.detector.contour_tree = self.gui and self.output.show_skin
+    with profiler.span("detect"):
+      hand = self.detector.detect(img)
+    # Store result in knowledge base.
+    # The history only keeps a compact record (no contours).
+    record = hand.record()
+    self.kb.update(record)
     if not self.test_mode:
       # Try to interprete as gesture
-      self.interprete(hand)
+      with profiler.span("gesture"):
+        self.interprete(record)
     return hand
 
   def interprete(self, hand):
     """
     Try to interprete the input as a gesture
+    (hand is a HandRecord)
     """
     self.gesture.add_hand(hand)
     operation = self.gesture.detect_gesture()
     self.action.execute(operation)
 
+  def wait_input(self):
+    """
+    Handle keyboard input until the next frame is due
+    """
+    self.scheduler.min_period = self.filters.config["wait_between_frames"] / 1000.0
+    self.handle_key(self.read_key(self.scheduler.remaining()))
+    self.scheduler.wait()
+
   def get_input(self):
     """
-    Get input from camera and keyboard
+    Get input from camera
     """
-    self.get_key()
-    _, img = self.camera.read()
-    img = cv2.resize(img, (self.FRAME_WIDTH, self.FRAME_HEIGHT))
-    if self.flip_camera:
-      img = cv2.flip(img, 1)
-    return img
+    with profiler.span("capture"):
+      return self.capture.read()
 
+  def read_key(self, timeout = None):
+    """
+    Wait up to timeout seconds for a key press (forever if timeout is None).
+    Returns the key code or -1.
+    """
+    if self.gui:
+      # The preview window needs waitKey for its event loop
+      if timeout is None:
+        return cv2.waitKey()
+      return cv2.waitKey(max(1, int(round(timeout * 1000))))
+    return self.read_stdin_key(timeout)
+
+  def read_stdin_key(self, timeout = None):
+    """
+    Non-blocking key input for headless mode.
+    Keys are typed into the terminal (followed by enter).
+    Line breaks are skipped.
+    """
+    end = None if timeout is None else time.time() + timeout
+    while not self.stdin_closed:
+      remaining = None if end is None else max(0, end - time.time())
+      ready, _, _ = select.select([sys.stdin], [], [], remaining)
+      if not ready:
+        return -1
+      c = os.read(sys.stdin.fileno(), 1)
+      if not c:
+        # End of input
+        self.stdin_closed = True
+      elif c not in "\r\n":
+        return ord(c)
+    if end is not None:
+      time.sleep(max(0, end - time.time()))
+    return -1
 
-  def get_key(self):
+  def handle_key(self, key):
     """
-    Read keyboard input
+    React on keyboard input
     """
-    key = cv2.waitKey(self.filters.config["wait_between_frames"])
     if key == ord('+'):
       # Reduce program speed
       self.filters.config["wait_between_frames"] += 500
@@ -180,7 +263,7 @@ class Tracker(object):
       self.output.make_screenshot()
     if key == ord('p') or key == ord(' '):
       # Pause
-      cv2.waitKey()
+      self.read_key()
     if key == ord('t'):
       # Test mode
       self.test_mode = not self.test_mode
@@ -219,14 +302,23 @@ class Tracker(object):
     """
     Skip to a different part of a video sequence.
     """
-    for i in range(0,x):
-      self.camera.grab()
+    self.capture.skip(x)
 
 if __name__=='__main__':
   """
   Start program with a logger
   """
+  parser = argparse.ArgumentParser(description="Robust realtime gesture recognition")
+  parser.add_argument("--headless", action="store_true",
+                      help="Run without trackbars and preview. Keys are read from stdin.")
+  parser.add_argument("--preview-fps", type=float, default=None,
+                      help="Maximum frame rate of the preview window (0: no preview)")
+  parser.add_argument("--target-fps", type=float, default=0,
+                      help="Maximum processing frame rate (0: as fast as possible)")
+  parser.add_argument("--video", help="Read frames from a video file")
+  args = parser.parse_args()
+
   logging.basicConfig(#filename = 'confidence.log',
                       format   = '%(message)s',
                       level    = logging.INFO)
-  Tracker()
+  Tracker(args.headless, args.preview_fps, args.target_fps, args.video)
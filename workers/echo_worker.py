@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Stub command worker for testing the WorkerBackend on any platform.
+Speaks the same protocol as osa_worker.js, but instead of executing
+the commands it appends them to a log file (or stderr).
+
+Usage: python workers/echo_worker.py [logfile]
+"""
+
+import sys
+
+def main():
+  log = open(sys.argv[1], "a") if len(sys.argv) > 1 else sys.stderr
+  batch = []
+  while True:
+    line = sys.stdin.readline()
+    if not line:
+      # End of input
+      break
+    line = line.rstrip("\n")
+    if line:
+      batch.append(line)
+      continue
+    # An empty line ends a batch
+    for cmd in batch:
+      log.write(cmd + "\n")
+    log.flush()
+    batch = []
+    sys.stdout.write("ok\n")
+    sys.stdout.flush()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,55 @@
+// Long-lived AppleScript worker (JavaScript for Automation).
+//
+// Reads batches of AppleScript lines from stdin. An empty line ends
+// a batch, which is then compiled and executed as one script.
+// Each batch is acknowledged with "ok" (or "error") on stdout.
+//
+// Usage: osascript -l JavaScript workers/osa_worker.js
+
+ObjC.import("Foundation");
+
+var compiled = {};
+
+function execute(lines) {
+  if (lines.length == 0) {
+    return true;
+  }
+  var source = lines.join("\n");
+  // Compiling is expensive. Gestures repeat the same commands.
+  if (!(source in compiled)) {
+    compiled[source] = $.NSAppleScript.alloc.initWithSource(source);
+  }
+  // Out parameter. Holds the error dictionary if the script failed.
+  var error = Ref();
+  compiled[source].executeAndReturnError(error);
+  return !error[0];
+}
+
+function reply(text) {
+  var stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+  stdout.writeData($(text + "\n").dataUsingEncoding($.NSUTF8StringEncoding));
+}
+
+function run(argv) {
+  var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+  var buffer = "";
+  var batch = [];
+  while (true) {
+    var data = stdin.availableData;
+    if (data.length == 0) {
+      // End of input. The tracker has quit.
+      break;
+    }
+    buffer += $.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding).js;
+    var lines = buffer.split("\n");
+    buffer = lines.pop();
+    for (var i = 0; i < lines.length; i++) {
+      if (lines[i] === "") {
+        reply(execute(batch) ? "ok" : "error");
+        batch = [];
+      } else {
+        batch.push(lines[i]);
+      }
+    }
+  }
+}